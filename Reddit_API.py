@@ -1,17 +1,70 @@
-from praw import Reddit
+import time
+import_started = time.perf_counter()  # For the import time in the run stats
 import os.path
+import sys
+import argparse
+import glob
+import re
+import zlib
+import bisect
+import heapq
+import math
+import random
 from pathlib import Path
+import csv
+import hashlib
 import json
+import mmap
+import sqlite3
+import tempfile
+import signal
+import itertools
 import requests
-import cv2 as cv
-import numpy as np
-import time
-from functools import wraps
+import importlib
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse, urlsplit
 import logging
 import requests.adapters
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from tqdm import tqdm
+
+class LazyModule:
+    """Module that is only imported on first attribute access
+    
+    Keeps praw, OpenCV, NumPy and tqdm out of the startup of runs that don't
+    need them (e.g. a cleanup answered from the cache never decodes an image).
+    The import time of each loaded module is kept in lazy_import_times.
+    """
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def _load(self):
+        with lazy_import_lock:
+            if self._module is None:
+                start = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                lazy_import_times[self._name] = time.perf_counter() - start
+        return self._module
+    
+    def __getattr__(self, attr):
+        module = self._module if self._module is not None else self._load()
+        return getattr(module, attr)
+
+lazy_import_times = {}  # Seconds spent importing each lazily loaded module
+lazy_import_lock = threading.RLock()
+
+praw = LazyModule("praw")
+cv = LazyModule("cv2")
+np = LazyModule("numpy")
+tqdm = LazyModule("tqdm")
 
 """Start Global variables"""
 dir_path = os.path.dirname(os.path.realpath(__file__))  # Path of this file
@@ -21,6 +74,40 @@ lst_sub_dir = os.path.join(dir_path, lst_sub_name)
 
 new_lst_img_name = "new_img.csv"
 new_lst_img_dir = os.path.join(dir_path, new_lst_img_name)
+
+CSV_HEADERS = ['id', 'subreddit_name', 'post_title', 'reddit_link']
+
+REMOVED_IMG_SHAPE = (60, 130)  # (height, width) of the "removed" placeholder image
+REMOVED_URL_MARKERS = ("/removed.png",)  # Redirect targets of removed images
+PROBE_BYTES = 65536  # Bytes fetched by the header probe before falling back
+THROTTLE_STATUS_CODES = (429, 503)  # Answers that slow down the host's rate limiter
+MAX_IMAGE_BYTES = 50 * 1024 * 1024  # Downloads larger than this are aborted
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"BM")  # Leading bytes of image files
+REDUCED_DECODE_FLAGS = {  # Names of the cv2 flags, looked up when decoding
+    1: "IMREAD_COLOR",
+    2: "IMREAD_REDUCED_COLOR_2",
+    4: "IMREAD_REDUCED_COLOR_4",
+    8: "IMREAD_REDUCED_COLOR_8",
+}
+
+CHECK_PATHS = ("cache", "revalidated", "probe", "full_decode")  # How a deletion check can be decided
+
+METRIC_STAGES = ("listing", "expand", "filter", "deletion_check", "decode", "dedup", "csv_write")
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Histogram bounds in seconds
+
+item_output = True  # Print one line per post/URL, see configure_output()
+interactive = True  # Prompts on stdin allowed, turned off by the command line interface
+
+# Per-run files that get a ".shard<i>of<N>" suffix when running one shard
+SHARDED_FILES = (
+    ("output_settings", "summary_filename", "new_img.csv"),
+    ("output_settings", "metrics_filename", "run_metrics_{mode}.json"),
+    ("output_settings", "prometheus_filename", None),
+    ("storage_settings", "journal_filename", "run_journal_{mode}.json"),
+    ("storage_settings", "checkpoint_filename", "listing_checkpoints.json"),
+    ("storage_settings", "cleanup_stats_filename", "cleanup_stats.json"),
+    ("storage_settings", "seen_index_filename", "seen_urls.npy"),
+)
 """End Global variables"""
 
 def setup_logging(config):
@@ -36,6 +123,243 @@ def setup_logging(config):
     )
     return logging.getLogger(__name__)
 
+def configure_output(config):
+    """Apply output_settings.per_item_output to print_item()"""
+    global item_output
+    item_output = config.get("output_settings", {}).get("per_item_output", True)
+
+def print_item(message):
+    """Print a per-post/per-URL line, unless per_item_output is turned off"""
+    if item_output:
+        print(message)
+
+class StageMetrics:
+    """Event counters and a latency histogram of one pipeline stage"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.calls = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.counters = {}
+    
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.calls += 1
+        self.latency_sum += seconds
+        self.latency_max = max(self.latency_max, seconds)
+    
+    def quantile(self, q):
+        """Estimate a latency quantile as the upper bound of its bucket"""
+        if not self.calls:
+            return None
+        seen = 0
+        for bound, n in zip(self.buckets, self.bucket_counts):
+            seen += n
+            if seen >= q * self.calls:
+                return min(bound, self.latency_max)
+        return self.latency_max
+    
+    def cumulative_counts(self):
+        """Return (upper_bound, count) pairs as Prometheus expects them"""
+        pairs = []
+        seen = 0
+        for bound, n in zip(self.buckets + ("+Inf",), self.bucket_counts):
+            seen += n
+            pairs.append((bound, seen))
+        return pairs
+    
+    @staticmethod
+    def _rounded(seconds):
+        return round(seconds, 6) if seconds is not None else None
+    
+    def to_dict(self):
+        return {
+            "counters": dict(self.counters),
+            "calls": self.calls,
+            "latency_seconds": {
+                "sum": round(self.latency_sum, 6),
+                "mean": round(self.latency_sum / self.calls, 6) if self.calls else None,
+                "max": round(self.latency_max, 6),
+                "p50": self._rounded(self.quantile(0.5)),
+                "p90": self._rounded(self.quantile(0.9)),
+                "p99": self._rounded(self.quantile(0.99)),
+                "buckets": {str(bound): count for bound, count in self.cumulative_counts()},
+            },
+        }
+
+class RunMetrics:
+    """Per-stage counters and latency histograms of a scraping or cleanup run
+    
+    Shared by all threads of the run; the instrumented stages are listed in
+    METRIC_STAGES.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self, mode=None):
+        """Start a new run"""
+        with self._lock:
+            self.mode = mode
+            self.started = time.time()
+            self._start = time.perf_counter()
+            self._stages = {}
+            self._startup = {}
+    
+    def _stage(self, stage):
+        if stage not in self._stages:
+            self._stages[stage] = StageMetrics()
+        return self._stages[stage]
+    
+    def count(self, stage, event, n=1):
+        """Add n to one of the stage's event counters"""
+        with self._lock:
+            counters = self._stage(stage).counters
+            counters[event] = counters.get(event, 0) + n
+    
+    def counters(self, stage):
+        """Return a copy of the stage's event counters"""
+        with self._lock:
+            return dict(self._stages[stage].counters) if stage in self._stages else {}
+    
+    def observe(self, stage, seconds):
+        """Record one latency of the stage"""
+        with self._lock:
+            self._stage(stage).observe(seconds)
+    
+    def startup(self, name, seconds):
+        """Record one of the startup timings (e.g. the login check)"""
+        with self._lock:
+            self._startup[name] = seconds
+    
+    def first_request(self, start, seconds):
+        """Record the first HTTP request of the run, started at perf_counter
+        value start and answered after seconds"""
+        if "first_request_seconds" in self._startup:
+            return
+        with self._lock:
+            if "first_request_seconds" not in self._startup:
+                self._startup["first_request_after_seconds"] = max(0.0, start - self._start)
+                self._startup["first_request_seconds"] = seconds
+    
+    def startup_report(self):
+        """Return the import times and first-request latency of the run"""
+        with lazy_import_lock:
+            imports = dict(lazy_import_times)
+        with self._lock:
+            startup = dict(self._startup)
+        report = {"module_import_seconds": round(module_import_seconds, 3),
+                  "lazy_imports": {name: round(seconds, 3) for name, seconds in sorted(imports.items())}}
+        report.update((name, round(seconds, 3)) for name, seconds in startup.items())
+        return report
+    
+    @contextmanager
+    def timer(self, stage):
+        """Record the time spent in the with block as one latency of the stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+    
+    def report(self):
+        """Return the run metrics as a JSON-serializable dict"""
+        with self._lock:
+            stages = {stage: self._stages[stage].to_dict()
+                      for stage in sorted(self._stages, key=lambda stage: (
+                          METRIC_STAGES.index(stage) if stage in METRIC_STAGES else len(METRIC_STAGES), stage))}
+            duration = time.perf_counter() - self._start
+        return {
+            "mode": self.mode,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(self.started)),
+            "duration_seconds": round(duration, 3),
+            "startup": self.startup_report(),
+            "stages": stages,
+        }
+    
+    def write_json(self, file_path):
+        """Write the report to file_path atomically"""
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+        os.replace(tmp_path, file_path)
+    
+    def write_prometheus(self, file_path):
+        """Write the metrics in the Prometheus text format (e.g. for the
+        node_exporter textfile collector), atomically"""
+        labels = f'mode="{self.mode or "run"}"'
+        lines = [
+            "# HELP reddit_scraper_stage_events_total Events counted by each pipeline stage",
+            "# TYPE reddit_scraper_stage_events_total counter",
+        ]
+        with self._lock:
+            stages = list(self._stages.items())
+            for stage, metrics in stages:
+                for event, value in sorted(metrics.counters.items()):
+                    lines.append(f'reddit_scraper_stage_events_total{{{labels},stage="{stage}",event="{event}"}} {value}')
+            lines += [
+                "# HELP reddit_scraper_stage_latency_seconds Latency of each pipeline stage",
+                "# TYPE reddit_scraper_stage_latency_seconds histogram",
+            ]
+            for stage, metrics in stages:
+                stage_labels = f'{labels},stage="{stage}"'
+                for bound, count in metrics.cumulative_counts():
+                    lines.append(f'reddit_scraper_stage_latency_seconds_bucket{{{stage_labels},le="{bound}"}} {count}')
+                lines.append(f"reddit_scraper_stage_latency_seconds_sum{{{stage_labels}}} {metrics.latency_sum}")
+                lines.append(f"reddit_scraper_stage_latency_seconds_count{{{stage_labels}}} {metrics.calls}")
+            duration = time.perf_counter() - self._start
+        lines += [
+            "# HELP reddit_scraper_run_duration_seconds Wall time of the run",
+            "# TYPE reddit_scraper_run_duration_seconds gauge",
+            f"reddit_scraper_run_duration_seconds{{{labels}}} {duration:.3f}",
+        ]
+        startup = self.startup_report()
+        lines += [
+            "# HELP reddit_scraper_import_seconds Time spent importing the script and each lazily loaded module",
+            "# TYPE reddit_scraper_import_seconds gauge",
+            f'reddit_scraper_import_seconds{{{labels},module="Reddit_API"}} {startup.pop("module_import_seconds")}',
+        ]
+        for name, seconds in startup.pop("lazy_imports").items():
+            lines.append(f'reddit_scraper_import_seconds{{{labels},module="{name}"}} {seconds}')
+        lines += [
+            "# HELP reddit_scraper_startup_seconds Startup timings of the run (login check, first request)",
+            "# TYPE reddit_scraper_startup_seconds gauge",
+        ]
+        for name, seconds in sorted(startup.items()):
+            lines.append(f'reddit_scraper_startup_seconds{{{labels},timing="{name.removesuffix("_seconds")}"}} {seconds}')
+        
+        tmp_path = file_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, file_path)
+
+run_metrics = RunMetrics()  # Metrics of the current run, reset by Reddit_API/scan_csv
+
+def write_run_report(config, dir_path):
+    """Write the run metrics to the files named in output_settings
+    
+    metrics_filename (JSON) and prometheus_filename may contain {mode},
+    which is replaced with "scrape" or "clean". An empty name disables the file.
+    """
+    output_settings = config.get("output_settings", {})
+    mode = run_metrics.mode or "run"
+    outputs = (
+        (output_settings.get("metrics_filename", "run_metrics_{mode}.json"), run_metrics.write_json),
+        (output_settings.get("prometheus_filename"), run_metrics.write_prometheus),
+    )
+    for file_name, write in outputs:
+        if not file_name:
+            continue
+        file_path = os.path.join(dir_path, file_name.format(mode=mode))
+        try:
+            write(file_path)
+            print(f"✓ Metrics saved to: {os.path.basename(file_path)}")
+        except OSError as e:
+            print(f"Error saving metrics to {file_path}: {e}")
+
 def create_token():
     """Create credentials by getting input from user"""
     creds = {}
@@ -60,6 +384,9 @@ def load_config(dir_path):
             print("✓ Loaded configuration from reddit_config.json")
             return config_data
     except FileNotFoundError:
+        if not interactive:
+            print(f"reddit_config.json not found in {dir_path}, run the scraper interactively once to create it")
+            return None
         return create_default_config(config_path)
 
 def create_default_config(config_path):
@@ -78,16 +405,56 @@ def create_default_config(config_path):
             "supported_formats": ["jpg", "png", "jpeg"],
             "excluded_domains": ["i.imgur.com"],
             "enable_duplicate_detection": True,
-            "enable_deleted_image_check": True
+            "enable_deleted_image_check": True,
+            "duplicate_hash_distance": 4,
+            "incremental": False,
+            "incremental_stop_after": 25,
+            "auto_create_subreddit_files": None,
+            "expand_galleries": True,
+            "verify_login": True
         },
         "performance_settings": {
             "request_timeout_seconds": 30,
             "retry_attempts": 3,
-            "rate_limit_delay": 1.0
+            "rate_limit_delay": 1.0,
+            "rate_limit_burst": 1,
+            "rate_limit_max_per_second": 20,
+            "max_workers": 8,
+            "max_requests_per_host": 4,
+            "max_parallel_subreddits": 4,
+            "cleanup_batch_size": 200,
+            "cleanup_request_budget": 0,
+            "cleanup_explore_fraction": 0.1,
+            "cleanup_recheck_hours": 168,
+            "cleanup_max_failures": 5,
+            "reddit_requests_per_minute": 60,
+            "cpu_processes": 0,
+            "cpu_queue_size": 0,
+            "progress_save_seconds": 60
         },
         "output_settings": {
             "csv_encoding": "utf-8-sig",
-            "summary_filename": "new_img.csv"
+            "summary_filename": "new_img.csv",
+            "per_item_output": True,
+            "metrics_filename": "run_metrics_{mode}.json",
+            "prometheus_filename": None
+        },
+        "storage_settings": {
+            "backend": "csv",
+            "sqlite_filename": "reddit_images.sqlite",
+            "hash_index_filename": "image_hashes.sqlite",
+            "checkpoint_filename": "listing_checkpoints.json",
+            "journal_filename": "run_journal_{mode}.json",
+            "cleanup_stats_filename": "cleanup_stats.json",
+            "seen_index_filename": "seen_urls.npy"
+        },
+        "cache_settings": {
+            "enable_url_cache": True,
+            "url_cache_filename": "url_cache.sqlite",
+            "url_cache_ttl_hours": 24,
+            "enable_image_cache": False,
+            "image_cache_dir": "image_cache",
+            "image_cache_max_mb": 1024
         }
     }
     
@@ -98,46 +465,337 @@ def create_default_config(config_path):
     print(f"✓ Configuration created: {config_path}")
     return config_data
 
-def create_session_with_retries():
-    """Create requests session with connection pooling and retries"""
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    return session
+class FetchEngine:
+    """HTTP connection pools shared by every image fetch of a run
+    
+    Wraps one requests.Session whose adapter keeps up to pool_maxsize
+    keep-alive connections per host, so connections (and TLS sessions) are
+    reused across subreddits and threads. Retries and the default timeout
+    come from performance_settings.
+    """
+    
+    def __init__(self, timeout=30, retry_attempts=3, pool_maxsize=4, pool_connections=64):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry_strategy = Retry(
+            total=retry_attempts,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 504],
+            respect_retry_after_header=False,  # 429/503 are handled by rate_limiter
+        )
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              max_retries=retry_strategy)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+    
+    @classmethod
+    def from_config(cls, config):
+        perf_settings = config.get("performance_settings", {})
+        return cls(timeout=perf_settings.get("request_timeout_seconds", 30),
+                   retry_attempts=perf_settings.get("retry_attempts", 3),
+                   pool_maxsize=max(1, perf_settings.get("max_requests_per_host", 4)))
+    
+    def get(self, url_str, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url_str, **kwargs)
+    
+    def close(self):
+        self.session.close()
+
+fetch_engine = None  # Engine of the current run, see get_fetch_engine()
+fetch_engine_lock = threading.Lock()
+
+def get_fetch_engine():
+    """Return the run's fetch engine, creating one with defaults if needed"""
+    global fetch_engine
+    with fetch_engine_lock:
+        if fetch_engine is None:
+            fetch_engine = FetchEngine()
+        return fetch_engine
+
+def set_fetch_engine(engine):
+    """Make engine the one used by fetches that don't pass their own"""
+    global fetch_engine
+    with fetch_engine_lock:
+        fetch_engine = engine
 
-def html_to_img(url_str, session=None, resize=False):
-    # Getting image from HTML page
+def http_get(url_str, session=None, **kwargs):
+    """GET a URL through the given session/engine or the run's fetch engine"""
     if session is None:
-        session = requests
+        session = get_fetch_engine()
+    kwargs.setdefault("timeout", getattr(session, "timeout", 30))
+    start = time.perf_counter()
+    resp = session.get(url_str, **kwargs)
+    run_metrics.first_request(start, time.perf_counter() - start)
+    return resp
+
+def read_image_bytes(url_str, session=None, max_bytes=MAX_IMAGE_BYTES):
+    """Stream an image into a single preallocated buffer
+    
+    Aborts with ValueError as soon as the image is larger than max_bytes,
+    and with requests.HTTPError on error answers (their body is no image).
+    Returns a uint8 NumPy array viewing the buffer (no copy).
+    """
+    resp = http_get(url_str, session, stream=True)
+    try:
+        if rate_limiter.observe(url_str, resp):
+            raise requests.HTTPError(f"Throttled by host ({resp.status_code}): {url_str}", response=resp)
+        resp.raise_for_status()
+        
+        raw = resp.raw
+        raw.decode_content = True
+        
+        # Size the buffer from Content-Length when the body isn't compressed
+        length = resp.headers.get("Content-Length")
+        if length and length.isdigit() and "Content-Encoding" not in resp.headers:
+            if int(length) > max_bytes:
+                raise ValueError(f"Image larger than {max_bytes} bytes: {url_str}")
+            buf = bytearray(int(length))
+        else:
+            buf = bytearray(min(max_bytes, 1024 * 1024))
+        
+        view = memoryview(buf)
+        pos = 0
+        while True:
+            if pos == len(buf):
+                # Unknown or wrong length: grow, or check the stream has ended
+                if len(buf) >= max_bytes:
+                    if raw.read(1):
+                        raise ValueError(f"Image larger than {max_bytes} bytes: {url_str}")
+                    break
+                view.release()
+                buf.extend(bytes(min(len(buf), max_bytes - len(buf))))
+                view = memoryview(buf)
+            n = raw.readinto(view[pos:])
+            if not n:
+                break
+            pos += n
+        view.release()
+    finally:
+        resp.close()
+    
+    return np.frombuffer(buf, dtype=np.uint8, count=pos)
+
+def has_image_signature(data):
+    """True if data starts like a JPEG, PNG, GIF, BMP or WebP file"""
+    head = bytes(data[:12])
+    return head.startswith(IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")
+
+def discard_cached_image(url_str):
+    """Drop a URL from the run's image cache, e.g. after its bytes failed to decode"""
+    cache = get_image_cache()
+    if cache is not None:
+        cache.discard(url_str)
+
+def load_image_bytes(url_str, session=None, max_bytes=MAX_IMAGE_BYTES):
+    """Return an image's bytes from the run's image cache, or download them
+    
+    Downloads wait for the host's rate limiter. Only bytes that look like
+    an image are added to the cache.
+    """
+    cache = get_image_cache()
+    if cache is not None:
+        data = cache.get(url_str)
+        run_metrics.count("image_cache", "hits" if data is not None else "misses")
+        if data is not None:
+            return data
     
-    resp = session.get(url_str, stream=True, timeout=30).raw
-    image = np.asarray(bytearray(resp.read()), dtype="uint8")
-    image = cv.imdecode(image, cv.IMREAD_COLOR)
+    rate_limiter.acquire(url_str)
+    data = read_image_bytes(url_str, session, max_bytes)
+    if cache is not None and has_image_signature(data):
+        cache.put(url_str, data)
+    return data
+
+def html_to_img(url_str, session=None, resize=False, reduce=1, max_bytes=MAX_IMAGE_BYTES):
+    """Download (or read from the image cache) and decode an image
+    
+    Args:
+        url_str: URL of the image
+        session: Optional requests session or FetchEngine (default: the run's engine)
+        resize: If True, resize the image to 352x627
+        reduce: Decode at 1/2, 1/4 or 1/8 resolution (2, 4 or 8) when the
+            caller doesn't need full resolution
+        max_bytes: Abort the download of images larger than this
+    """
+    image = load_image_bytes(url_str, session, max_bytes)
+
+    if resize == True and reduce == 1:
+        # Decode at the lowest resolution that is still larger than the target
+        size = read_image_size(image[:PROBE_BYTES].tobytes())
+        if size is not None:
+            for factor in (8, 4, 2):
+                if size[0] // factor >= 627 and size[1] // factor >= 352:
+                    reduce = factor
+                    break
 
     if resize == True:
-        # Could do transforms on images like resize!
-        image = cv.resize(image, (352, 627))
+        # Could do transforms on images like resize! Done in the CPU stage,
+        # only the thumbnail comes back
+        img = run_cpu_task("thumbnail", image, size=(352, 627), reduce=reduce)
+    else:
+        # A full-size image costs more to send back from a worker than to decode here
+        run_metrics.count("decode", "decode")
+        run_metrics.count("decode", "bytes", image.nbytes)
+        with run_metrics.timer("decode"):
+            img = cv.imdecode(image, decode_flag(reduce))
+    
+    if img is None:
+        discard_cached_image(url_str)
+    return img
+
+def decode_flag(reduce):
+    """cv2 imread flag decoding at 1/reduce of the full resolution"""
+    return getattr(cv, REDUCED_DECODE_FLAGS.get(reduce, "IMREAD_COLOR"))
 
-    return image
+def decode_size(data):
+    """Decode an image and return its (height, width), or None"""
+    img = cv.imdecode(data, cv.IMREAD_COLOR)
+    return None if img is None else img.shape[:2]
 
-def create_reddit_client(credentials):
-    """Create and test Reddit client connection"""
+def decode_dhash(data, reduce=4):
+    """Decode an image at reduced resolution and return its dHash, or None"""
+    img = cv.imdecode(data, decode_flag(reduce))
+    return None if img is None else dhash_img(img)
+
+def decode_thumbnail(data, size=(352, 627), reduce=1):
+    """Decode an image and resize it to size (width, height), or None"""
+    img = cv.imdecode(data, decode_flag(reduce))
+    return None if img is None else cv.resize(img, size)
+
+def image_difference(pixels, data, shape):
+    """Compare decoded pixels of the given shape with an encoded image
+    
+    Returns None if the image has another size (or can't be decoded), else
+    the number of non-zero values of cv.subtract(pixels, image).
+    """
+    img = cv.imdecode(data, cv.IMREAD_COLOR)
+    if img is None or img.shape[:2] != tuple(shape[:2]):
+        return None
+    difference = cv.subtract(pixels.reshape(shape), img)
+    b, g, r = cv.split(difference)
+    return cv.countNonZero(b) + cv.countNonZero(g) + cv.countNonZero(r)
+
+CPU_TASKS = {
+    "size": decode_size,
+    "dhash": decode_dhash,
+    "thumbnail": decode_thumbnail,
+    "difference": image_difference,
+}
+
+def run_shared_task(task, shm_name, sizes, kwargs):
+    """Worker process entry point: run a CPU task on buffers in shared memory"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    error = None
+    try:
+        block = np.ndarray((sum(sizes),), dtype=np.uint8, buffer=shm.buf)
+        views = []
+        offset = 0
+        for size in sizes:
+            views.append(block[offset:offset + size])
+            offset += size
+        try:
+            result = CPU_TASKS[task](*views, **kwargs)
+        except Exception as e:
+            result, error = None, f"{task} failed: {type(e).__name__}: {e}"
+        # The block can only be closed once no array views it anymore
+        del block, views
+    finally:
+        shm.close()
+    if error is not None:
+        raise ValueError(error)
+    return result
+
+class CpuPool:
+    """Worker processes for the CPU-heavy image work of a run
+    
+    Raw image bytes are handed over in shared memory and only small results
+    (sizes, hashes, thumbnails) come back. At most max_pending tasks are
+    queued or running: network threads calling run() wait for a free slot,
+    so downloads can't outrun decoding and memory stays bounded, while the
+    queue keeps every process busy.
+    """
+    
+    def __init__(self, processes, max_pending=None):
+        self.processes = processes
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * processes)
+        # Forking a process that runs network threads is not safe
+        self._executor = ProcessPoolExecutor(max_workers=processes,
+                                             mp_context=multiprocessing.get_context("spawn"))
+    
+    @classmethod
+    def from_config(cls, config):
+        """Return a pool if performance_settings.cpu_processes is set, else None"""
+        perf_settings = config.get("performance_settings", {})
+        processes = perf_settings.get("cpu_processes", 0)
+        if not processes:
+            return None
+        return cls(processes, perf_settings.get("cpu_queue_size") or None)
+    
+    def run(self, task, *buffers, **kwargs):
+        """Run CPU_TASKS[task] on uint8 arrays in a worker and return its result"""
+        sizes = [buf.nbytes for buf in buffers]
+        with self._slots:
+            shm = shared_memory.SharedMemory(create=True, size=max(1, sum(sizes)))
+            try:
+                block = np.ndarray((sum(sizes),), dtype=np.uint8, buffer=shm.buf)
+                offset = 0
+                for buf, size in zip(buffers, sizes):
+                    block[offset:offset + size] = buf.reshape(-1)
+                    offset += size
+                del block
+                return self._executor.submit(run_shared_task, task, shm.name, sizes, kwargs).result()
+            finally:
+                shm.close()
+                shm.unlink()
+    
+    def close(self):
+        self._executor.shutdown()
+
+cpu_pool = None  # Pool of the current run, see get_cpu_pool()
+cpu_pool_lock = threading.Lock()
+
+def get_cpu_pool():
+    """Return the run's CPU pool, or None to do CPU work in the calling thread"""
+    with cpu_pool_lock:
+        return cpu_pool
+
+def set_cpu_pool(pool):
+    global cpu_pool
+    with cpu_pool_lock:
+        cpu_pool = pool
+
+def run_cpu_task(task, *buffers, **kwargs):
+    """Run one of CPU_TASKS in the run's CPU pool, or in this thread without one"""
+    pool = get_cpu_pool()
+    run_metrics.count("decode", task)
+    run_metrics.count("decode", "bytes", sum(buf.nbytes for buf in buffers))
+    with run_metrics.timer("decode"):
+        if pool is None:
+            return CPU_TASKS[task](*buffers, **kwargs)
+        return pool.run(task, *buffers, **kwargs)
+
+def create_reddit_client(credentials, verify_login=True):
+    """Create and test Reddit client connection
+    
+    Without verify_login the login round trip is skipped; bad credentials
+    then fail the first listing request instead.
+    """
+    reddit = None
     try:
-        reddit = Reddit(
+        reddit = praw.Reddit(
             client_id=credentials["client_id"],
             client_secret=credentials["client_secret"],
             user_agent=credentials["user_agent"],
             username=credentials["username"],
             password=credentials["password"],
         )
+        if not verify_login:
+            print("✓ Reddit client ready (login not checked)")
+            return reddit
         # Test the connection by getting user info
+        start = time.perf_counter()
         user = reddit.user.me()
+        run_metrics.startup("login_check_seconds", time.perf_counter() - start)
         print(f"✓ Connected to Reddit as: {user.name}")
         return reddit
     except Exception as e:
@@ -178,150 +836,1560 @@ def should_create_subreddit_file(subreddit_name, file_path):
             return response == 'y'
         print("Please enter 'y' for yes or 'n' for no.")
 
-def process_subreddit(reddit, subreddit_name, config, dir_path):
-    """Process a single subreddit and return new images found"""
+def ensure_subreddit_created(subreddit_name, store, config, dir_path):
+    """Make sure a subreddit exists in the store, return False to skip it
+    
+    scraping_settings.auto_create_subreddit_files decides without asking when
+    set to true/false; when unset (null) the user is prompted.
+    """
+    if store.exists(subreddit_name):
+        return True
+    
+    auto_create = config["scraping_settings"].get("auto_create_subreddit_files")
+    if auto_create is None and not interactive:
+        print(f"No file for r/{subreddit_name} (set auto_create_subreddit_files or use --new-subreddits create)")
+        auto_create = False
+    if auto_create is None:
+        lst_img_dir = os.path.join(dir_path, f"{subreddit_name}_img_list.csv")
+        auto_create = should_create_subreddit_file(subreddit_name, lst_img_dir)
+    
+    if not auto_create:
+        print(f"Skipping r/{subreddit_name}...")
+        return False
+    store.create(subreddit_name)
+    return True
+
+class RedditBudget:
+    """Reddit API request budget shared by all subreddits of a run
+    
+    PRAW is not thread-safe, so listing requests are also serialized here.
+    """
+    
+    def __init__(self, requests_per_minute=60):
+        self.interval = 60.0 / requests_per_minute
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+    
+    @contextmanager
+    def request(self, cost=1):
+        """Hold the Reddit client for a call worth cost API requests"""
+        with self._lock:
+            wait = self._next_slot - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                yield
+            finally:
+                self._next_slot = time.monotonic() + self.interval * cost
+
+class ScrapeContext:
+    """Resources shared by all subreddits of a scraping or cleanup run
+    
+    With mode="clean", the scraping-only resources (duplicate index and
+    listing checkpoints) are not opened, and the cleanup scheduler is.
+    """
+    
+    def __init__(self, config, dir_path, subreddit_names=(), mode="scrape"):
+        perf_settings = config.get("performance_settings", {})
+        rate_limiter.configure(config)
+        configure_output(config)
+        self.config = config
+        self.url_filter = UrlFilter.from_config(config)
+        self.cache = open_url_cache(config, dir_path)
+        self.store = open_image_store(config, dir_path, subreddit_names)
+        self.dedup_index = open_duplicate_index(config, dir_path) if mode == "scrape" else None
+        self.checkpoints = open_listing_checkpoints(config, dir_path) if mode == "scrape" else None
+        self.scheduler = open_cleanup_scheduler(config, dir_path, self.cache) if mode == "clean" else None
+        self.fetch_engine = FetchEngine.from_config(config)
+        set_fetch_engine(self.fetch_engine)
+        self.cpu_pool = CpuPool.from_config(config)
+        set_cpu_pool(self.cpu_pool)
+        self.image_cache = open_image_cache(config, dir_path)
+        set_image_cache(self.image_cache)
+        self.request_limits = RequestLimits(perf_settings.get("max_requests_per_host", 4),
+                                            perf_settings.get("max_workers", 8))
+        self.reddit_budget = RedditBudget(perf_settings.get("reddit_requests_per_minute", 60))
+        self.journal = None  # RunJournal, set by Reddit_API/scan_csv
+        self.stop = threading.Event()  # Set to make workers save their progress and stop
+    
+    def close(self):
+        self.store.close()
+        self.fetch_engine.close()
+        if get_fetch_engine() is self.fetch_engine:
+            set_fetch_engine(None)
+        if self.cpu_pool is not None:
+            if get_cpu_pool() is self.cpu_pool:
+                set_cpu_pool(None)
+            self.cpu_pool.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.image_cache is not None:
+            if get_image_cache() is self.image_cache:
+                set_image_cache(None)
+            self.image_cache.close()
+        if self.dedup_index is not None:
+            self.dedup_index.close()
+        if self.scheduler is not None:
+            self.scheduler.save()
+
+class RunJournal:
+    """Progress of a scraping or cleanup run, saved so an interrupted run can resume
+    
+    Kept in a JSON file, saved atomically. Per subreddit it records whether
+    it is done, the posts stored so far and those the store failed to save
+    (scrape), and the number of leading rows already checked and of rows
+    removed (clean). The file is removed once the run completes with every
+    post stored.
+    """
+    
+    def __init__(self, file_path, mode, resume=False):
+        self.file_path = file_path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._subreddits = {}
+        if not resume:
+            return
+        try:
+            with open(file_path, 'r') as f:
+                self._subreddits = json.load(f).get("subreddits", {})
+            print(f"✓ Resuming from {os.path.basename(file_path)}")
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError, AttributeError) as e:
+            print(f"Error reading {file_path}, starting over: {e}")
+    
+    def _entry(self, subreddit_name):
+        return self._subreddits.setdefault(subreddit_name, {"done": False, "posts": [], "unsaved": [],
+                                                            "position": 0, "removed": 0})
+    
+    def is_done(self, subreddit_name):
+        with self._lock:
+            return self._subreddits.get(subreddit_name, {}).get("done", False)
+    
+    def posts(self, subreddit_name):
+        """Posts stored for the subreddit by the interrupted run"""
+        with self._lock:
+            return list(self._subreddits.get(subreddit_name, {}).get("posts", []))
+    
+    def unsaved(self, subreddit_name):
+        """Posts of the subreddit the store failed to save, to retry on resume"""
+        with self._lock:
+            return list(self._subreddits.get(subreddit_name, {}).get("unsaved", []))
+    
+    def position(self, subreddit_name):
+        """Number of leading rows of the subreddit already checked"""
+        with self._lock:
+            return self._subreddits.get(subreddit_name, {}).get("position", 0)
+    
+    def removed(self, subreddit_name):
+        with self._lock:
+            return self._subreddits.get(subreddit_name, {}).get("removed", 0)
+    
+    def add_posts(self, subreddit_name, posts):
+        """Record stored posts, saves always include the earlier unsaved ones"""
+        with self._lock:
+            entry = self._entry(subreddit_name)
+            entry["posts"].extend(posts)
+            entry["unsaved"] = []
+        self.save()
+    
+    def set_unsaved(self, subreddit_name, posts):
+        with self._lock:
+            self._entry(subreddit_name)["unsaved"] = list(posts)
+        self.save()
+    
+    def set_position(self, subreddit_name, position, removed):
+        with self._lock:
+            entry = self._entry(subreddit_name)
+            entry["position"] = position
+            entry["removed"] = removed
+        self.save()
+    
+    def mark_done(self, subreddit_name):
+        with self._lock:
+            self._entry(subreddit_name)["done"] = True
+        self.save()
+    
+    def save(self):
+        """Write the journal to disk atomically"""
+        with self._lock:
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({"mode": self.mode, "subreddits": self._subreddits}, f)
+            os.replace(tmp_path, self.file_path)
+    
+    def finish(self):
+        """Remove the journal of a completed run
+        
+        Returns False, keeping the journal, if some posts were not stored.
+        """
+        with self._lock:
+            if any(entry.get("unsaved") for entry in self._subreddits.values()):
+                return False
+            try:
+                os.remove(self.file_path)
+            except FileNotFoundError:
+                pass
+        return True
+
+def open_run_journal(config, dir_path, mode, resume=None):
+    """Open the run journal of mode ("scrape" or "clean")
+    
+    With resume=None, asks whether to resume if an interrupted run left a
+    journal behind (without prompts, it always resumes).
+    """
+    file_name = config.get("storage_settings", {}).get("journal_filename", "run_journal_{mode}.json")
+    file_path = os.path.join(dir_path, file_name.format(mode=mode))
+    if resume is None and not interactive:
+        resume = True
+    if resume is None:
+        resume = False
+        if os.path.exists(file_path):
+            answer = input(f"An interrupted {mode} run was found. Resume it? (y/n): ").strip().lower()
+            resume = answer in ("y", "yes")
+    return RunJournal(file_path, mode, resume)
+
+@contextmanager
+def stop_on_interrupt(stop_event):
+    """Turn the first Ctrl+C into stop_event, so workers can save their progress
+    
+    A second Ctrl+C interrupts at once. Only the main thread can handle
+    signals; elsewhere this does nothing.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    
+    def handler(signum, frame):
+        print("\nSaving progress before stopping (press Ctrl+C again to quit now)...")
+        stop_event.set()
+        signal.signal(signal.SIGINT, previous)
+    
+    previous = signal.signal(signal.SIGINT, handler)
+    if previous is None:
+        previous = signal.default_int_handler
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+LISTING_TYPES = ("top", "new", "hot")
+
+def get_listing(subreddit, search_type, post_limit):
+    """Return the subreddit listing generator selected by search_type"""
+    if search_type not in LISTING_TYPES:
+        print(f"Warning: Unknown search_type '{search_type}', using top")
+        search_type = "top"
+    return getattr(subreddit, search_type)(limit=post_limit)
+
+LISTING_PAGE_SIZE = 100  # Posts per listing request
+
+def iter_listing_pages(listing, reddit_budget):
+    """Yield the listing's submissions, holding the Reddit client only while a page is fetched
+    
+    The consumer's work (like the incremental known checks) runs between
+    pages, outside the budget lock, so other subreddits can use the client.
+    """
+    listing = iter(listing)
+    while True:
+        with reddit_budget.request():
+            with run_metrics.timer("listing"):
+                page = list(itertools.islice(listing, LISTING_PAGE_SIZE))
+        yield from page
+        if len(page) < LISTING_PAGE_SIZE:
+            return
+
+class ListingCheckpoints:
+    """Per-subreddit, per-listing high-water marks kept in a JSON file
+    
+    Each mark is the fullname and created_utc of the newest post seen in the
+    last complete run of that listing.
+    """
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._marks = {}
+        try:
+            with open(file_path, 'r') as f:
+                self._marks = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error reading {file_path}, starting without checkpoints: {e}")
+    
+    def get(self, subreddit_name, search_type):
+        with self._lock:
+            return self._marks.get(subreddit_name, {}).get(search_type)
+    
+    def update(self, subreddit_name, search_type, submissions, failed=()):
+        """Move the mark to the newest of the given submissions
+        
+        With failed submissions (checks that errored), the mark stays older
+        than all of them, so the next run reads them again.
+        """
+        if failed:
+            oldest_failed = min(submission.created_utc for submission in failed)
+            submissions = [submission for submission in submissions if submission.created_utc < oldest_failed]
+        if not submissions:
+            return
+        newest = max(submissions, key=lambda submission: submission.created_utc)
+        with self._lock:
+            mark = self._marks.setdefault(subreddit_name, {}).get(search_type)
+            if mark is None or newest.created_utc > mark["created_utc"]:
+                self._marks[subreddit_name][search_type] = {
+                    "fullname": newest.fullname,
+                    "created_utc": newest.created_utc,
+                }
+    
+    def save(self):
+        """Write the marks to disk atomically"""
+        with self._lock:
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._marks, f, indent=4)
+            os.replace(tmp_path, self.file_path)
+
+def open_listing_checkpoints(config, dir_path):
+    """Open the listing checkpoints if incremental scraping is enabled"""
+    if not config.get("scraping_settings", {}).get("incremental", False):
+        return None
+    file_name = config.get("storage_settings", {}).get("checkpoint_filename", "listing_checkpoints.json")
+    return ListingCheckpoints(os.path.join(dir_path, file_name))
+
+def iter_incremental(listing, search_type, mark, is_known, stop_after=25):
+    """Yield submissions until the listing reaches known territory
+    
+    The "new" listing is chronological, so it stops at the first post that is
+    not newer than the mark. "top" and "hot" are not, so they stop after
+    stop_after consecutive known posts. Breaking out of the PRAW generator
+    also stops it from requesting more pages.
+    """
+    known_streak = 0
+    for count, submission in enumerate(listing):
+        if mark is not None and search_type == "new":
+            if submission.created_utc <= mark["created_utc"] or submission.fullname == mark["fullname"]:
+                print(f"✓ Reached known posts after {count} posts, stopped paging")
+                return
+        elif mark is not None and submission.created_utc <= mark["created_utc"] and is_known(submission):
+            known_streak += 1
+            if known_streak >= stop_after:
+                print(f"✓ Reached known posts after {count + 1} posts, stopped paging")
+                return
+        else:
+            known_streak = 0
+        yield submission
+
+INFO_BATCH_SIZE = 100  # Most fullnames reddit.info() resolves in one API call
+
+def gallery_image_urls(data):
+    """Return the full-size i.redd.it URLs of a gallery in gallery order
+    
+    Returns None if the gallery's media_metadata is missing from data.
+    """
+    media_metadata = data.get("media_metadata")
+    if not media_metadata:
+        return None
+    items = (data.get("gallery_data") or {}).get("items") or [{"media_id": media_id} for media_id in media_metadata]
+    urls = []
+    for item in items:
+        media_id = item.get("media_id")
+        media = media_metadata.get(media_id) or {}
+        if media.get("status") != "valid" or media.get("e") != "Image":
+            continue
+        # The original is served from i.redd.it under the media id, e.g. "image/png" -> .png
+        ext = media.get("m", "").rpartition("/")[2]
+        if ext:
+            urls.append(f"https://i.redd.it/{media_id}.{ext}")
+    return urls
+
+def preview_image_url(data):
+    """Return the i.redd.it URL of the largest preview image, or None
+    
+    Only previews hosted on preview.redd.it are used; their path is the
+    original's, so no variant needs to be downloaded to find the best one.
+    """
+    images = (data.get("preview") or {}).get("images") or []
+    if not images:
+        return None
+    variants = [images[0].get("source")] + list(images[0].get("resolutions") or [])
+    best = max((variant for variant in variants if variant and variant.get("url")),
+               key=lambda variant: variant.get("width", 0) * variant.get("height", 0), default=None)
+    if best is None:
+        return None
+    parts = urlsplit(best["url"])
+    if parts.hostname != "preview.redd.it":
+        return None
+    return f"https://i.redd.it{parts.path}"
+
+def expand_submission(data, url_filter):
+    """Return (urls, missing) for a post's loaded attributes
+    
+    urls lists the post's image URLs: one per gallery image, the parent's
+    images for a crosspost, or the post URL itself (its preview if the URL
+    is not an image). If the metadata needed is missing, urls is None and
+    missing is the fullname to fetch.
+    """
+    if data.get("is_gallery"):
+        urls = gallery_image_urls(data)
+        return (urls, None) if urls is not None else (None, data.get("name"))
+    
+    parents = data.get("crosspost_parent_list")
+    if parents:
+        return expand_submission(parents[0], url_filter)
+    if data.get("crosspost_parent"):
+        return None, data["crosspost_parent"]
+    
+    url_str = str(data.get("url") or "")
+    if url_filter.is_image(url_str.lower()):
+        return [url_str], None
+    if data.get("post_hint") == "image":
+        preview_url = preview_image_url(data)
+        if preview_url is not None:
+            return [preview_url], None
+    return [url_str], None
+
+def expand_submissions(reddit, submissions, url_filter, budget=None, batch_size=INFO_BATCH_SIZE):
+    """Expand posts into (submission, url_str) pairs, one per image
+    
+    Only attributes already loaded from the listing are read (a missing
+    PRAW attribute would cost one API call per post). Posts whose metadata
+    is missing are fetched together, batch_size fullnames per
+    reddit.info() call.
+    """
+    expanded = []
+    missing = {}
+    for submission in submissions:
+        urls, fullname = expand_submission(vars(submission), url_filter)
+        expanded.append((submission, urls, fullname))
+        if urls is None and fullname:
+            missing[fullname] = None
+    
+    for batch in iter_batches(list(missing), batch_size):
+        try:
+            with budget.request() if budget is not None else nullcontext():
+                fetched = list(reddit.info(fullnames=batch))
+        except Exception as e:
+            print(f"Error fetching metadata of {len(batch)} posts: {e}")
+            continue
+        run_metrics.count("expand", "info_calls")
+        run_metrics.count("expand", "posts_fetched", len(fetched))
+        for item in fetched:
+            urls, _ = expand_submission(vars(item), url_filter)
+            missing[item.fullname] = urls
+    
+    pairs = []
+    for submission, urls, fullname in expanded:
+        if urls is None:
+            # Fall back to the post URL if the metadata could not be fetched
+            urls = missing.get(fullname) or [str(submission.url)]
+        if len(urls) > 1:
+            run_metrics.count("expand", "extra_images", len(urls) - 1)
+        pairs.extend((submission, url_str.lower()) for url_str in urls)
+    return pairs
+
+def process_subreddit(reddit, subreddit_name, config, dir_path, context=None):
+    """Process a single subreddit and return new images found
+    
+    Args:
+        context: ScrapeContext shared with the other subreddits of the run,
+            a private one is opened (and closed) if not given
+    
+    New posts are saved every progress_save_seconds (and recorded in the
+    run journal), so an interruption only loses the last few checks.
+    
+    Returns (new_posts_data, new_images, added_urls), where added_urls is the
+    set of URLs stored during this run.
+    """
+    if context is None:
+        context = ScrapeContext(config, dir_path, [subreddit_name])
+        try:
+            return process_subreddit(reddit, subreddit_name, config, dir_path, context)
+        finally:
+            context.close()
+    
+    journal = context.journal
+    if context.stop.is_set():
+        return [], [], set()
+    if journal is not None and journal.is_done(subreddit_name):
+        posts = journal.posts(subreddit_name)
+        print(f"✓ r/{subreddit_name} was completed by the interrupted run, skipped")
+        return posts, [post['reddit_link'] for post in posts], set()
+    
     print(f"\n--- Processing r/{subreddit_name} ---")
 
-    # Set up file paths
-    lst_img_name = f"{subreddit_name}_img_list.csv"
-    lst_img_dir = os.path.join(dir_path, lst_img_name)
+    store = context.store
+    checkpoints = context.checkpoints
+    dedup_index = context.dedup_index
+    url_filter = context.url_filter
 
-    # Check if CSV file exists
-    if not os.path.exists(lst_img_dir):
-        if not should_create_subreddit_file(subreddit_name, lst_img_dir):
-            print(f"Skipping r/{subreddit_name}...")
-            return [], [], set()
+    # Check if the subreddit is already stored
+    if not ensure_subreddit_created(subreddit_name, store, config, dir_path):
+        return [], [], set()
+
+    # Get configuration values
+    post_limit = config["scraping_settings"]["post_limit"]
+    
+    # Initialize lists, continuing the interrupted run's numbering on resume
+    saved_posts = journal.posts(subreddit_name) if journal is not None else []
+    unsaved_posts = journal.unsaved(subreddit_name) if journal is not None else []
+    new_images = []
+    added_set = {post['reddit_link'] for post in unsaved_posts}  # Not stored yet, for the duplicate checks
+    count = len(saved_posts) + len(unsaved_posts)
+    
+    # URLs queued or added during this run, older ones are looked up in the store
+    already_done_set = set(added_set)
+    
+    # Get concurrency settings (older configs may not have them)
+    max_workers = config.get("performance_settings", {}).get("max_workers", 8)
+    save_seconds = config.get("performance_settings", {}).get("progress_save_seconds", 60)
+    
+    search_type = config["scraping_settings"].get("search_type", "top")
+    expand = config["scraping_settings"].get("expand_galleries", True)
+    
+    try:
+        subreddit = reddit.subreddit(subreddit_name)
+        listing = iter_listing_pages(get_listing(subreddit, search_type, post_limit),
+                                     context.reddit_budget)
+        
+        def is_stored(url_str):
+            """True if the URL is in the subreddit's file or added by this run"""
+            return url_str in added_set or store.is_seen(subreddit_name, url_str)
+        
+        # In incremental mode, stop paging once the listing reaches known posts
+        if checkpoints is not None:
+            def is_known(submission):
+                urls = expand_submission(vars(submission), url_filter)[0] if expand else [submission.url]
+                if urls is None:
+                    return False
+                return all(not url_filter.is_image(url_str.lower())
+                           or store.is_seen(subreddit_name, url_str.lower())
+                           or (dedup_index is not None
+                               and dedup_index.is_duplicate(subreddit_name, url_str.lower(), is_stored))
+                           for url_str in urls)
+            
+            mark = checkpoints.get(subreddit_name, search_type)
+            stop_after = config["scraping_settings"].get("incremental_stop_after", 25)
+            listing = iter_incremental(listing, search_type, mark, is_known, stop_after)
+        
+        submissions = list(listing)
+        run_metrics.count("listing", "posts", len(submissions))
+        
+        # Initialize list to store post data
+        new_posts_data = []
+        
+        def save_progress():
+            """Store the posts added since the last save"""
+            pending = new_posts_data[len(saved_posts):]
+            if not pending:
+                return
+            # Timed by the store, once per write
+            saved = store.add_posts(subreddit_name, pending)
+            if saved:
+                run_metrics.count("csv_write", "rows_added", len(pending))
+                saved_posts.extend(pending)
+                if journal is not None:
+                    journal.add_posts(subreddit_name, pending)
+                if dedup_index is not None:
+                    with run_metrics.timer("dedup"):
+                        dedup_index.commit(subreddit_name, [post['reddit_link'] for post in pending])
+        
+        # One entry per image, galleries and crossposts can hold several
+        if expand:
+            with run_metrics.timer("expand"):
+                entries = expand_submissions(reddit, submissions, url_filter, context.reddit_budget)
+        else:
+            entries = [(submission, str(submission.url.lower())) for submission in submissions]
+        run_metrics.count("expand", "urls", len(entries))
+        
+        # Filter posts first, so only the new candidates get checked
+        candidates = []
+        skipped = {UrlFilter.UNSUPPORTED_FORMAT: 0, UrlFilter.EXCLUDED_DOMAIN: 0,
+                   UrlFilter.INVALID_URL: 0, "already_seen": 0, "known_duplicate": 0}
+        with run_metrics.timer("filter"):
+            urls = [url_str for _, url_str in entries]
+            for (submission, url_str), label in zip(entries, url_filter.classify_many(urls)):
+                # Only supported image formats on allowed domains
+                if label != UrlFilter.IMAGE:
+                    skipped[label] += 1
+                    if label == UrlFilter.EXCLUDED_DOMAIN:
+                        print_item(f"Skipped excluded domain: {submission.domain}")
+                
+                # Check if we already have this URL
+                elif url_str in already_done_set or store.is_seen(subreddit_name, url_str):
+                    skipped["already_seen"] += 1
+                    print_item(f"Already exists: {url_str}")
+                elif dedup_index is not None and dedup_index.is_duplicate(subreddit_name, url_str, is_stored):
+                    skipped["known_duplicate"] += 1
+                    print_item(f"Known duplicate: {url_str}")
+                else:
+                    candidates.append((submission, url_str))
+                    already_done_set.add(url_str)
+        run_metrics.count("filter", "candidates", len(candidates))
+        for event, n in skipped.items():
+            run_metrics.count("filter", event, n)
+        
+        # Check candidates concurrently, results come back in listing order
+        checked = iter_checked_images([url_str for _, url_str in candidates], context.fetch_engine,
+                                      max_workers=max_workers, cache=context.cache,
+                                      hash_images=dedup_index is not None,
+                                      limits=context.request_limits)
+        
+        # Posts the interrupted run failed to store are saved again with the new ones
+        new_posts_data.extend(saved_posts)
+        new_posts_data.extend(unsaved_posts)
+        failed_submissions = []  # Their checks errored, the listing checkpoint stays below them
+        next_save = time.monotonic() + save_seconds
+        for (submission, url_str), (_, deleted_flag, error, img_hash) in tqdm.tqdm(zip(candidates, checked),
+                      desc=f"Processing r/{subreddit_name}",
+                      total=len(candidates),
+                      unit="post",
+                      colour="green",
+                      bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} posts [{elapsed}<{remaining}]\n"):
+            if context.stop.is_set():
+                break
+            if time.monotonic() >= next_save:
+                save_progress()
+                next_save = time.monotonic() + save_seconds
+            
+            duplicate_of = None
+            if dedup_index is not None and img_hash is not None:
+                with run_metrics.timer("dedup"):
+                    duplicate_of = dedup_index.find_duplicate(subreddit_name, url_str, img_hash, is_stored)
+                run_metrics.count("dedup", "duplicates" if duplicate_of is not None else "unique")
+            
+            if error is not None:
+                already_done_set.discard(url_str)
+                failed_submissions.append(submission)
+                print(f"Error processing {url_str}: {error}")
+            elif duplicate_of is not None:
+                with run_metrics.timer("dedup"):
+                    dedup_index.add_duplicate(subreddit_name, url_str, img_hash, duplicate_of)
+                print_item(f"Skipped duplicate of {duplicate_of}: {url_str}")
+            elif not deleted_flag:
+                if dedup_index is not None:
+                    with run_metrics.timer("dedup"):
+                        dedup_index.add(subreddit_name, url_str, img_hash)
+                
+                # Create post data dictionary with sequential numbering
+                post_data = {
+                    'id': count + 1,  # Use count + 1 for 1-based indexing
+                    'subreddit_name': subreddit_name,
+                    'post_title': submission.title,
+                    'reddit_link': url_str
+                }
+                
+                # Add to our lists
+                new_posts_data.append(post_data)
+                new_images.append(url_str)
+                added_set.add(url_str)
+                count += 1
+                print_item(f"ID-{count}-Added: {url_str}")
+            else:
+                already_done_set.discard(url_str)
+                print_item(f"Skipped deleted image: {url_str}")
+        
+        # Cancel the checks still queued if the run is stopping
+        checked.close()
+        
+        # Save only the new posts to the subreddit's file
+        save_progress()
+        unsaved_posts = new_posts_data[len(saved_posts):]
+        if unsaved_posts:
+            # Keep them for a resumed run, and read this listing again then
+            if journal is not None:
+                journal.set_unsaved(subreddit_name, unsaved_posts)
+            print(f"Could not save {len(unsaved_posts)} new images of r/{subreddit_name}, "
+                  f"stored {len(saved_posts)}")
+            return saved_posts, [post['reddit_link'] for post in saved_posts], already_done_set
+        if context.stop.is_set():
+            print(f"✓ Saved {len(saved_posts)} new images of r/{subreddit_name} before stopping")
+            return saved_posts, [post['reddit_link'] for post in saved_posts], already_done_set
+        
+        if checkpoints is not None:
+            checkpoints.update(subreddit_name, search_type, submissions, failed_submissions)
+            checkpoints.save()
+        if journal is not None:
+            journal.mark_done(subreddit_name)
+        
+        print(f"✓ Found {len(saved_posts)} new images in r/{subreddit_name}")
+        return saved_posts, [post['reddit_link'] for post in saved_posts], already_done_set
+        
+    except Exception as e:
+        print(f"Error accessing r/{subreddit_name}: {e}")
+        return saved_posts, [post['reddit_link'] for post in saved_posts], already_done_set
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds, or None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """Thread-safe token bucket on monotonic time
+    
+    The rate starts at rate. Successful requests raise it by a quarter of
+    that each, up to max_rate, and every throttling answer halves it and
+    pauses the bucket (for the Retry-After delay if given), so it settles
+    just below what the host accepts. With rate None requests are not
+    paced, but throttling answers still pause the bucket.
+    """
+    
+    def __init__(self, rate, capacity=1.0, max_rate=None):
+        self.start_rate = rate
+        self.max_rate = max(rate, max_rate or rate) if rate else None
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()  # In the future while paused
+        self._lock = threading.Lock()
+    
+    def reserve(self):
+        """Take a token, return how many seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                return max(0.0, self.updated - now)
+            if now > self.updated:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(0.0, self.updated - now) + wait
+    
+    def throttle(self, retry_after=None):
+        with self._lock:
+            if self.rate is not None:
+                self.rate = max(self.start_rate / 64, self.rate / 2)
+            pause = retry_after if retry_after is not None else 1.0 / (self.rate or 1.0)
+            until = time.monotonic() + pause
+            if until > self.updated:
+                # Tokens refill from the end of the pause, so only one request goes then
+                self.updated = until
+                self.tokens = min(self.tokens, 1.0)
+    
+    def succeed(self):
+        with self._lock:
+            if self.rate is not None and self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.start_rate / 4)
+
+class HostRateLimiter:
+    """Per-host token buckets shared by all threads of a run
+    
+    Configured from performance_settings: rate_limit_delay is the starting
+    delay between two requests to the same host (0 turns pacing off, but
+    throttling answers still pause the host),
+    rate_limit_max_per_second the rate each host may speed up to while it
+    doesn't throttle, and rate_limit_burst the number of requests allowed
+    back to back.
+    """
+    
+    def __init__(self, requests_per_second=2.0, burst=1.0, max_per_second=20.0):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_per_second = max_per_second
+        self._buckets = {}
+        self._lock = threading.Lock()
+    
+    def configure(self, config):
+        perf_settings = config.get("performance_settings", {})
+        delay = perf_settings.get("rate_limit_delay", 1.0 / self.requests_per_second
+                                  if self.requests_per_second else 0)
+        with self._lock:
+            self.requests_per_second = 1.0 / delay if delay and delay > 0 else None
+            self.burst = max(1.0, float(perf_settings.get("rate_limit_burst", 1)))
+            self.max_per_second = perf_settings.get("rate_limit_max_per_second", 20.0)
+            self._buckets = {}
+    
+    def bucket(self, url_str):
+        host = urlparse(url_str).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.requests_per_second, self.burst, self.max_per_second)
+            return self._buckets[host]
+    
+    def acquire(self, url_str):
+        """Block until a request to the host of url_str is allowed"""
+        wait = self.bucket(url_str).reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    def observe(self, url_str, resp):
+        """Adapt the host's rate to a response, returns True if it was throttled
+        
+        Throttled hosts are paused even when pacing is off (rate_limit_delay 0).
+        """
+        bucket = self.bucket(url_str)
+        if resp.status_code in THROTTLE_STATUS_CODES:
+            bucket.throttle(parse_retry_after(resp.headers.get("Retry-After")))
+            return True
+        bucket.succeed()
+        return False
+
+rate_limiter = HostRateLimiter()  # Image hosts, configured by Reddit_API/scan_csv
+
+class RequestLimits:
+    """Cap the number of in-flight requests per host and, optionally, in total
+    
+    One instance can be shared by several worker pools (e.g. one per
+    subreddit) to keep the caps global for the whole run.
+    """
+    
+    def __init__(self, max_per_host, max_in_flight=None):
+        self.max_per_host = max_per_host
+        self._in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+        self._semaphores = {}
+        self._lock = threading.Lock()
+    
+    def get(self, url_str):
+        host = urlparse(url_str).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+    
+    @contextmanager
+    def slot(self, url_str):
+        """Wait for a free request slot for url_str"""
+        if self._in_flight is None:
+            with self.get(url_str):
+                yield
+        else:
+            with self._in_flight, self.get(url_str):
+                yield
+
+def iter_checked_images(urls, session=None, max_workers=8, max_per_host=4, cache=None,
+                        hash_images=False, limits=None):
+    """Check URLs for deleted images in parallel
+    
+    The worker pool caps the number of in-flight checks, and each host gets at
+    most max_per_host of them (or the caps of limits, a shared RequestLimits).
+    Results are yielded in input order as (url_str, deleted_flag, error,
+    img_hash) tuples, with error set when the check failed. img_hash is the
+    dHash of live images if hash_images is True.
+    """
+    if limits is None:
+        limits = RequestLimits(max_per_host)
+    
+    def check_one(url_str):
+        with limits.slot(url_str):
+            try:
+                with run_metrics.timer("deletion_check"):
+                    deleted_flag = check_deleted_img(url_str, session, cache)
+                run_metrics.count("deletion_check", "deleted" if deleted_flag else "live")
+                img_hash = None
+                if hash_images and not deleted_flag:
+                    img_hash = hash_image_url(url_str, session)
+                return url_str, deleted_flag, None, img_hash
+            except Exception as e:
+                run_metrics.count("deletion_check", "errors")
+                return url_str, True, e, None
+    
+    if not urls:
+        return
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        yield from executor.map(check_one, urls)
+    finally:
+        # Closed early: drop the checks that haven't started
+        executor.shutdown(wait=True, cancel_futures=True)
+
+class UrlFilter:
+    """Classify post URLs by file extension and domain, built once per run
+    
+    The extension is taken from the end of the URL path (query and fragment
+    ignored) and looked up in a frozen set. Domain rules match the URL's
+    host: "example.com" matches only that host, "*.example.com" also
+    matches any of its subdomains.
+    """
+    
+    IMAGE = "image"
+    UNSUPPORTED_FORMAT = "unsupported_format"
+    EXCLUDED_DOMAIN = "excluded_domain"
+    INVALID_URL = "invalid_url"
+    
+    def __init__(self, supported_formats, excluded_domains=()):
+        self.extensions = frozenset(fmt.lower().lstrip(".") for fmt in supported_formats)
+        exact, wildcard = set(), set()
+        for rule in excluded_domains:
+            rule = rule.lower().strip().rstrip(".")
+            if rule.startswith("*."):
+                wildcard.add(rule[2:])
+            elif rule:
+                exact.add(rule)
+        self.excluded_hosts = frozenset(exact)
+        self.excluded_suffixes = frozenset(wildcard)
+        # Listings repeat the same few hosts, so remember their verdicts
+        self.is_excluded_host = lru_cache(maxsize=4096)(self._match_host)
+    
+    @classmethod
+    def from_config(cls, config):
+        scraping_settings = config.get("scraping_settings", {})
+        return cls(scraping_settings.get("supported_formats", ["jpg", "png", "jpeg"]),
+                   scraping_settings.get("excluded_domains", []))
+    
+    def _match_host(self, host):
+        if host in self.excluded_hosts or host in self.excluded_suffixes:
+            return True
+        # "a.b.example.com" is checked against "b.example.com", "example.com" and "com"
+        pos = host.find(".")
+        while pos != -1:
+            if host[pos + 1:] in self.excluded_suffixes:
+                return True
+            pos = host.find(".", pos + 1)
+        return False
+    
+    def classify(self, url_str):
+        """Return IMAGE, UNSUPPORTED_FORMAT, EXCLUDED_DOMAIN or INVALID_URL"""
+        try:
+            parts = urlsplit(url_str)
+            host = parts.hostname
+        except (ValueError, AttributeError):
+            return self.INVALID_URL
+        
+        name = parts.path.rsplit("/", 1)[-1]
+        dot = name.rfind(".")
+        if dot == -1 or name[dot + 1:].lower() not in self.extensions:
+            return self.UNSUPPORTED_FORMAT
+        if host and self.is_excluded_host(host):
+            return self.EXCLUDED_DOMAIN
+        return self.IMAGE
+    
+    def classify_many(self, urls):
+        """Classify a whole listing, returns the labels in input order"""
+        classify = self.classify
+        return [classify(url_str) for url_str in urls]
+    
+    def is_image(self, url_str):
+        return self.classify(url_str) == self.IMAGE
+
+def is_valid_image_url(url, supported_formats):
+    """Check if URL points to a supported image format
+    
+    Builds a one-off UrlFilter; build one with UrlFilter.from_config() when
+    checking many URLs.
+    """
+    return UrlFilter(supported_formats).is_image(url)
+
+def read_image_size(header_bytes):
+    """Read (height, width) from the first bytes of a PNG, GIF or JPEG file
+    
+    Returns None if the format is unknown or the size is not in header_bytes.
+    """
+    data = header_bytes
+    
+    # PNG: the IHDR chunk always comes first
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR" and len(data) >= 24:
+        width = int.from_bytes(data[16:20], "big")
+        height = int.from_bytes(data[20:24], "big")
+        return height, width
+    
+    # GIF: logical screen size right after the signature
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width = int.from_bytes(data[6:8], "little")
+        height = int.from_bytes(data[8:10], "little")
+        return height, width
+    
+    # JPEG: walk the marker segments until a start-of-frame marker
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:  # Fill byte
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without length
+                i += 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height = int.from_bytes(data[i + 5:i + 7], "big")
+                width = int.from_bytes(data[i + 7:i + 9], "big")
+                return height, width
+            i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    
+    return None
+
+def probe_deleted_img(url_str, session=None, probe_bytes=PROBE_BYTES, validators=None):
+    """Decide if an image is deleted without downloading all of it
+    
+    Uses the status code, the redirect target and a ranged GET of the first
+    probe_bytes of the file to read the image size from its header.
+    If validators (a cache entry with etag/last_modified) are given, the
+    request is conditional and a 304 answer is reported as not_modified.
+    
+    Returns (deleted_flag, info) where deleted_flag is True/False, or None if
+    the probe can't decide, and info holds etag, last_modified, size,
+    not_modified and throttled.
+    """
+    headers = {"Range": f"bytes=0-{probe_bytes - 1}"}
+    if validators:
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+    
+    resp = http_get(url_str, session, headers=headers, stream=True)
+    info = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "size": None,
+        "not_modified": resp.status_code == 304,
+        "throttled": rate_limiter.observe(url_str, resp),
+    }
+    try:
+        if info["not_modified"] or info["throttled"]:
+            return None, info
+        if resp.status_code in (404, 410):
+            return True, info
+        if resp.history and any(marker in resp.url for marker in REMOVED_URL_MARKERS):
+            return True, info
+        if resp.status_code not in (200, 206):
+            return None, info
+        
+        # Servers ignoring the Range header send everything, only read the start
+        info["size"] = read_image_size(resp.raw.read(probe_bytes, decode_content=True))
+        if info["size"] is None:
+            return None, info
+        return info["size"] == REMOVED_IMG_SHAPE, info
+    finally:
+        resp.close()
+
+class UrlStatusCache:
+    """Persistent SQLite cache of the last deletion check of each URL
+    
+    Entries younger than ttl_seconds are trusted as is. Older entries of live
+    images are re-validated with a conditional request (ETag/Last-Modified).
+    Failed checks are counted per URL (failures, failed_at) until the next
+    successful one, URLs never checked get an entry with checked_at 0.
+    """
+    
+    def __init__(self, db_path, ttl_seconds):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS url_status (
+                url TEXT PRIMARY KEY,
+                deleted INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                height INTEGER,
+                width INTEGER,
+                failures INTEGER NOT NULL DEFAULT 0,
+                failed_at REAL
+            )""")
+        # Caches written before failures were tracked
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(url_status)")}
+        if "failures" not in columns:
+            self._conn.execute("ALTER TABLE url_status ADD COLUMN failures INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("ALTER TABLE url_status ADD COLUMN failed_at REAL")
+        self._conn.commit()
+    
+    COLUMNS = "deleted, checked_at, etag, last_modified, height, width, failures, failed_at"
+    
+    @staticmethod
+    def _entry(row):
+        return {
+            "deleted": bool(row[0]),
+            "checked_at": row[1],
+            "etag": row[2],
+            "last_modified": row[3],
+            "size": (row[4], row[5]) if row[4] is not None else None,
+            "failures": row[6],
+            "failed_at": row[7],
+        }
+    
+    def get(self, url_str):
+        """Return the cached entry for a URL as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self.COLUMNS} FROM url_status WHERE url = ?", (url_str,)).fetchone()
+        return None if row is None else self._entry(row)
+    
+    def get_many(self, urls, chunk_size=500):
+        """Return the cached entries of several URLs as {url: entry}"""
+        entries = {}
+        with self._lock:
+            for start in range(0, len(urls), chunk_size):
+                chunk = urls[start:start + chunk_size]
+                rows = self._conn.execute(
+                    f"SELECT url, {self.COLUMNS} "
+                    f"FROM url_status WHERE url IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+                entries.update((row[0], self._entry(row[1:])) for row in rows)
+        return entries
+    
+    def is_fresh(self, entry):
+        return time.time() - entry["checked_at"] < self.ttl_seconds
+    
+    def failed_recently(self, entry):
+        """True if the last check of the URL failed less than ttl_seconds ago"""
+        return entry["failed_at"] is not None and time.time() - entry["failed_at"] < self.ttl_seconds
+    
+    def put(self, url_str, deleted_flag, etag=None, last_modified=None, size=None):
+        """Store the result of a check, clearing its failure count"""
+        height, width = size if size else (None, None)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO url_status VALUES (?, ?, ?, ?, ?, ?, ?, 0, NULL)",
+                (url_str, int(deleted_flag), time.time(), etag, last_modified, height, width))
+            self._conn.commit()
+    
+    def record_failure(self, url_str):
+        """Count a failed check of a URL, returns its consecutive failures"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO url_status (url, deleted, checked_at, failures, failed_at) VALUES (?, 0, 0, 1, ?) "
+                "ON CONFLICT(url) DO UPDATE SET failures = failures + 1, failed_at = excluded.failed_at",
+                (url_str, now))
+            self._conn.commit()
+            return self._conn.execute("SELECT failures FROM url_status WHERE url = ?", (url_str,)).fetchone()[0]
+    
+    def touch(self, url_str):
+        """Mark an entry as checked now (after a 304 re-validation)"""
+        with self._lock:
+            self._conn.execute("UPDATE url_status SET checked_at = ? WHERE url = ?",
+                               (time.time(), url_str))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_url_cache(config, dir_path):
+    """Open the URL status cache from config settings, None if disabled"""
+    cache_settings = config.get("cache_settings", {})
+    if not cache_settings.get("enable_url_cache", True):
+        return None
+    
+    cache_path = os.path.join(dir_path, cache_settings.get("url_cache_filename", "url_cache.sqlite"))
+    ttl_seconds = cache_settings.get("url_cache_ttl_hours", 24) * 3600
+    try:
+        cache = UrlStatusCache(cache_path, ttl_seconds)
+        print(f"✓ Using URL status cache: {os.path.basename(cache_path)}")
+        return cache
+    except sqlite3.Error as e:
+        print(f"Could not open URL status cache {cache_path}: {e}")
+        return None
+
+class CleanupScheduler:
+    """Chooses the stored URLs a cleanup pass with a request budget checks
+    
+    Each URL not checked within the URL cache TTL gets a score estimating how
+    likely it is to be dead: the deletion rate of its domain and of its
+    subreddit, scaled up with the time since its last check and with its age
+    (rows are stored oldest first). The budget goes to the highest scores,
+    except explore_fraction of it, which goes to a random sample so the rates
+    of rarely chosen domains stay current. Rates are learned from the checks
+    of budgeted passes and kept in a JSON file. URLs whose last check failed
+    wait for the URL cache TTL before they are chosen again.
+    """
+    
+    PRIOR_CHECKS = 20  # Weight, in checks, of the overall rate in a domain's or subreddit's rate
+    MAX_CHECKS = 1000  # Counts are halved past this, so rates follow recent checks
+    CACHE_CHUNK = 500  # URLs looked up in the URL cache at once while planning
+    
+    def __init__(self, file_path, budget, explore_fraction=0.1, recheck_hours=168):
+        self.file_path = file_path
+        self.budget = budget
+        self.explore_fraction = explore_fraction
+        self.recheck_seconds = recheck_hours * 3600
+        self._lock = threading.Lock()
+        self._stats = {"domains": {}, "subreddits": {}}  # key -> [checks, deleted]
+        self._selected = {}  # subreddit -> URLs to check this pass
+        try:
+            with open(file_path, 'r') as f:
+                self._stats.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"Error reading {file_path}, starting without deletion rates: {e}")
+    
+    def _rate(self, kind, key, prior):
+        checks, deleted = self._stats[kind].get(key, (0, 0))
+        return (deleted + self.PRIOR_CHECKS * prior) / (checks + self.PRIOR_CHECKS)
+    
+    def score(self, subreddit_name, url_str, entry, age, now, prior):
+        """Estimated chance (0 to 1) that a URL is dead
+        
+        entry is its URL cache entry (None if never checked), age its row's
+        place in the file from 0 (newest) to 1 (oldest).
+        """
+        if entry is not None and entry["deleted"]:
+            return 1.0
+        rate = (self._rate("domains", urlparse(url_str).netloc.lower(), prior)
+                + self._rate("subreddits", subreddit_name, prior)) / 2
+        staleness = 1.0
+        if entry is not None:
+            staleness = 1 - math.exp(-max(0.0, now - entry["checked_at"]) / self.recheck_seconds)
+        return rate * staleness * (0.5 + 0.5 * age)
+    
+    def plan(self, subreddit_names, store, cache, journal=None):
+        """Choose the URLs of this pass, returns how many were chosen
+        
+        Rows already checked by an interrupted run (see journal) are left out.
+        """
+        explore_count = int(self.budget * self.explore_fraction)
+        top_count = self.budget - explore_count
+        top = []  # Min-heap of (score, n, subreddit, url), the top_count best
+        sample = []  # Uniform sample of explore_count (subreddit, url)
+        rng = random.Random()
+        now = time.time()
+        with self._lock:
+            checks = sum(counts[0] for counts in self._stats["domains"].values())
+            deleted = sum(counts[1] for counts in self._stats["domains"].values())
+        prior = (deleted + 1) / (checks + 2)
+        
+        due = 0
+        for sub in subreddit_names:
+            if journal is not None and journal.is_done(sub):
+                continue
+            if not store.exists(sub):
+                continue
+            position = journal.position(sub) if journal is not None else 0
+            # Rows are streamed twice (count, then score), so memory doesn't grow with the file
+            row_count = max(1, sum(1 for _ in store.iter_rows(sub)) - position)
+            rows = itertools.islice(store.iter_rows(sub), position, None)
+            k = 0
+            for urls in iter_batches((row['reddit_link'] for row in rows if row.get('reddit_link')),
+                                     self.CACHE_CHUNK):
+                entries = cache.get_many(urls)
+                for url_str in urls:
+                    age = max(0.0, 1 - k / row_count)
+                    k += 1
+                    entry = entries.get(url_str)
+                    if entry is not None and (cache.is_fresh(entry) or cache.failed_recently(entry)):
+                        continue
+                    due += 1
+                    item = (self.score(sub, url_str, entry, age, now, prior), due, sub, url_str)
+                    if len(top) < top_count:
+                        heapq.heappush(top, item)
+                    elif top_count and item > top[0]:
+                        heapq.heapreplace(top, item)
+                    
+                    if len(sample) < explore_count:
+                        sample.append((sub, url_str))
+                    elif rng.randrange(due) < explore_count:
+                        sample[rng.randrange(explore_count)] = (sub, url_str)
+        
+        self._selected = {}
+        for sub, url_str in itertools.chain(((item[2], item[3]) for item in top), sample):
+            self._selected.setdefault(sub, set()).add(url_str)
+        chosen = sum(len(urls) for urls in self._selected.values())
+        run_metrics.count("deletion_check", "scheduled", chosen)
+        run_metrics.count("deletion_check", "deferred", due - chosen)
+        print(f"✓ Cleanup budget: checking {chosen} of {due} URLs due for a check")
+        return chosen
+    
+    def selected_count(self, subreddit_name):
+        return len(self._selected.get(subreddit_name, ()))
+    
+    def is_selected(self, subreddit_name, url_str):
+        return url_str in self._selected.get(subreddit_name, ())
+    
+    def record(self, subreddit_name, url_str, deleted_flag):
+        """Count the result of a check in the domain and subreddit rates"""
+        with self._lock:
+            for kind, key in (("domains", urlparse(url_str).netloc.lower()), ("subreddits", subreddit_name)):
+                counts = self._stats[kind].setdefault(key, [0, 0])
+                counts[0] += 1
+                counts[1] += int(deleted_flag)
+                if counts[0] > self.MAX_CHECKS:
+                    counts[0] /= 2
+                    counts[1] /= 2
+    
+    def save(self):
+        """Write the rates to disk atomically"""
+        with self._lock:
+            tmp_path = self.file_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._stats, f, indent=4)
+            os.replace(tmp_path, self.file_path)
 
-    # Create session for this subreddit
-    session = create_session_with_retries()
+def open_cleanup_scheduler(config, dir_path, cache):
+    """Open the cleanup scheduler if cleanup_request_budget is set, else None
+    
+    It needs the URL status cache, which remembers when each URL was checked.
+    """
+    perf_settings = config.get("performance_settings", {})
+    budget = perf_settings.get("cleanup_request_budget", 0)
+    if not budget:
+        return None
+    if cache is None:
+        print("cleanup_request_budget needs enable_url_cache, checking every URL")
+        return None
+    file_name = config.get("storage_settings", {}).get("cleanup_stats_filename", "cleanup_stats.json")
+    return CleanupScheduler(os.path.join(dir_path, file_name), budget,
+                            perf_settings.get("cleanup_explore_fraction", 0.1),
+                            perf_settings.get("cleanup_recheck_hours", 168))
 
-    # Get configuration values
-    post_limit = config["scraping_settings"]["post_limit"]
-    supported_formats = config["scraping_settings"]["supported_formats"]
-    excluded_domains = config["scraping_settings"]["excluded_domains"]
+class ImageCache:
+    """Content-addressed local copy of downloaded images
     
-    # Initialize lists
-    new_images = []
-    count = 0
+    Each distinct image is stored once, under its SHA-256 digest in
+    <cache_dir>/<first two hex digits>/<digest>, and an SQLite index maps
+    URLs to digests. Once the files outgrow max_bytes the least recently
+    used ones are evicted. Reads are memory-mapped, so cached bytes are not
+    copied before decoding.
+    """
     
-    # Set up file paths
-    lst_img_name = f"{subreddit_name}_img_list.csv"
-    lst_img_dir = os.path.join(dir_path, lst_img_name)
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS urls_digest ON urls (digest)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
     
-    # Load existing URLs
-    past_result = past_list(lst_img_dir)
-    already_done_set = set(past_result)
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], digest)
     
-    try:
-        subreddit = reddit.subreddit(subreddit_name)
-        submissions = list(subreddit.top(limit=post_limit))
-        
-        # Initialize list to store post data
-        new_posts_data = []
-        
-        # Search for posts
-        for submission in tqdm(submissions, 
-                      desc=f"Processing r/{subreddit_name}",
-                      total=len(submissions),
-                      unit="post",
-                      colour="green",
-                      bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} posts [{elapsed}<{remaining}]\n"):
-            url_str = str(submission.url.lower())
-            
-            # Check if it's an image with supported format
-            if any(f".{fmt}" in url_str for fmt in supported_formats):
-                
-                # Check if we already have this URL
-                if url_str not in already_done_set:
-                    domain_name = submission.domain
-                    
-                    # Skip excluded domains
-                    if domain_name not in excluded_domains:
-                        try:
-                            # Check if image is deleted
-                            deleted_flag = check_deleted_img(url_str, session)
-                            
-                            if not deleted_flag:
-                                # Create post data dictionary with sequential numbering
-                                post_data = {
-                                    'id': count + 1,  # Use count + 1 for 1-based indexing
-                                    'subreddit_name': subreddit_name,
-                                    'post_title': submission.title,
-                                    'reddit_link': url_str
-                                }
-                                
-                                # Add to our lists
-                                new_posts_data.append(post_data)
-                                new_images.append(url_str)
-                                already_done_set.add(url_str)
-                                count += 1
-                                print(f"ID-{count}-Added: {url_str}")
-                            else:
-                                print(f"Skipped deleted image: {url_str}")
-                                
-                        except Exception as e:
-                            print(f"Error processing {url_str}: {e}")
-                    else:
-                        print(f"Skipped excluded domain: {domain_name}")
-                else:
-                    print(f"Already exists: {url_str}")
-        
-        # Save only the new posts to the subreddit's file
-        if new_posts_data:
-            save_urls_to_csv(new_posts_data, lst_img_dir, f"new {subreddit_name} images", append=True)
+    def get(self, url_str):
+        """Return the cached bytes of a URL as a read-only uint8 array, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT digest FROM urls WHERE url = ?", (url_str,)).fetchone()
+            if row is None:
+                return None
+            digest = row[0]
+            self._conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), digest))
+            self._conn.commit()
         
-        print(f"✓ Found {count} new images in r/{subreddit_name}")
-        return new_posts_data, new_images, already_done_set
+        try:
+            with open(self.path_for(digest), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # The file was removed behind our back
+            with self._lock:
+                self._conn.execute("DELETE FROM urls WHERE url = ?", (url_str,))
+                self._conn.commit()
+            return None
+        # The array keeps the mapping open as long as it is in use
+        return np.frombuffer(mapped, dtype=np.uint8)
+    
+    def put(self, url_str, data):
+        """Store the bytes of a URL's image, returns their digest"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
         
-    except Exception as e:
-        print(f"Error accessing r/{subreddit_name}: {e}")
-        return [], already_done_set
-
-def rate_limit(calls_per_second=1):
-    """Decorator to rate limit function calls"""
-    min_interval = 1.0 / calls_per_second
-    last_called = [0.0]
-    
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            elapsed = time.time() - last_called[0]
-            left_to_wait = min_interval - elapsed
-            if left_to_wait > 0:
-                time.sleep(left_to_wait)
-            ret = func(*args, **kwargs)
-            last_called[0] = time.time()
-            return ret
-        return wrapper
-    return decorator
+        now = time.time()
+        with self._lock:
+            added = self._conn.execute("INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+                                       (digest, len(data), now)).rowcount
+            if added:
+                self._total_bytes += len(data)
+            else:
+                self._conn.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (now, digest))
+            self._conn.execute("INSERT OR REPLACE INTO urls VALUES (?, ?, ?)", (url_str, digest, now))
+            self._evict()
+            self._conn.commit()
+        return digest
+    
+    def discard(self, url_str):
+        """Forget a URL, its bytes are evicted once no longer used"""
+        with self._lock:
+            self._conn.execute("DELETE FROM urls WHERE url = ?", (url_str,))
+            self._conn.commit()
+    
+    def _evict(self):
+        """Remove least recently used images until the cache fits max_bytes"""
+        while self._total_bytes > self.max_bytes:
+            rows = self._conn.execute("SELECT digest, size FROM blobs ORDER BY last_used LIMIT 100").fetchall()
+            if not rows:
+                break
+            for digest, size in rows:
+                try:
+                    os.remove(self.path_for(digest))
+                except OSError:
+                    pass
+                self._conn.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                self._conn.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+                self._total_bytes -= size
+                run_metrics.count("image_cache", "evicted")
+                if self._total_bytes <= self.max_bytes:
+                    break
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-def is_valid_image_url(url, supported_formats):
-    """Check if URL points to a supported image format"""
+def open_image_cache(config, dir_path):
+    """Open the image cache from config settings, None if disabled"""
+    cache_settings = config.get("cache_settings", {})
+    if not cache_settings.get("enable_image_cache", False):
+        return None
+    
+    cache_dir = os.path.join(dir_path, cache_settings.get("image_cache_dir", "image_cache"))
+    max_bytes = int(cache_settings.get("image_cache_max_mb", 1024) * 1024 * 1024)
     try:
-        url_lower = url.lower()
-        return any(f".{fmt}" in url_lower for fmt in supported_formats)
-    except Exception:
-        return False
+        cache = ImageCache(cache_dir, max_bytes)
+        print(f"✓ Using image cache: {os.path.basename(cache_dir)}")
+        return cache
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not open image cache {cache_dir}: {e}")
+        return None
 
-@rate_limit(calls_per_second=2)  # Max 2 requests per second
-def check_deleted_img(url_str, session=None):
-    deleted_flag = False
+image_cache = None  # Image cache of the current run, see get_image_cache()
+image_cache_lock = threading.Lock()
 
-    img = html_to_img(url_str, session)
-    [h, w] = [img.shape[0], img.shape[1]]
+def get_image_cache():
+    """Return the run's image cache, or None if it is disabled"""
+    with image_cache_lock:
+        return image_cache
 
-    if [h, w] != [60, 130]:
-        pass
-    else:
-        deleted_flag = True
+def set_image_cache(cache):
+    global image_cache
+    with image_cache_lock:
+        image_cache = cache
+
+def count_check_path(path):
+    """Record which of CHECK_PATHS decided a deletion check"""
+    run_metrics.count("deletion_check", path)
+
+def print_check_stats():
+    """Print how often each deletion check path was taken in the current run"""
+    counters = run_metrics.counters("deletion_check")
+    check_stats = {path: counters.get(path, 0) for path in CHECK_PATHS}
+    if sum(check_stats.values()):
+        print(f"✓ Deletion checks: {check_stats['cache']} from cache, "
+              f"{check_stats['revalidated']} re-validated, "
+              f"{check_stats['probe']} decided by header probe, "
+              f"{check_stats['full_decode']} by full decode")
 
+def print_startup_stats():
+    """Print the import times and first-request latency of the run"""
+    startup = run_metrics.startup_report()
+    imports = startup["module_import_seconds"] + sum(startup["lazy_imports"].values())
+    line = f"✓ Startup: {imports:.2f}s importing"
+    if startup["lazy_imports"]:
+        line += f" ({', '.join(startup['lazy_imports'])} loaded on demand)"
+    if "first_request_seconds" in startup:
+        line += (f", first request after {startup['first_request_after_seconds']:.2f}s"
+                 f" took {startup['first_request_seconds']:.2f}s")
+    print(line)
+
+def check_deleted_img(url_str, session=None, cache=None):
+    """Check if an image is deleted, using the URL status cache if given"""
+    entry = cache.get(url_str) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        count_check_path("cache")
+        return entry["deleted"]
+    
+    # Only live images are worth a conditional re-validation
+    validators = entry if entry is not None and not entry["deleted"] else None
+    deleted_flag, info = fetch_deleted_status(url_str, session, validators)
+    
+    if cache is not None:
+        if info["not_modified"]:
+            cache.touch(url_str)
+        else:
+            cache.put(url_str, deleted_flag, info["etag"], info["last_modified"], info["size"])
+    
     return deleted_flag
 
-def safe_check_deleted_img(url_str, max_retries=3):
+class NotAnImageError(ValueError):
+    """The host answered, but its body is not an image that can be decoded"""
+
+def is_transient_error(error):
+    """True if a failed check says nothing about the image
+    
+    Timeouts, connection errors and throttling or server error answers
+    (429, 5xx) are transient. Other error answers (403, 451...) and bodies
+    that are not images are not.
+    """
+    if isinstance(error, NotAnImageError):
+        return False
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in THROTTLE_STATUS_CODES or status >= 500
+    return True
+
+def fetch_deleted_status(url_str, session=None, validators=None, max_attempts=3):
+    """Check an image over the network, returns (deleted_flag, info)
+    
+    Requests wait for the host's rate limiter; throttled probes are retried
+    up to max_attempts times after the host's Retry-After delay.
+    """
+    # Try the cheap header probe first
+    for attempt in range(max_attempts):
+        rate_limiter.acquire(url_str)
+        deleted_flag, info = probe_deleted_img(url_str, session, validators=validators)
+        if not info["throttled"]:
+            break
+    else:
+        raise requests.HTTPError(f"Still throttled after {max_attempts} attempts: {url_str}")
+    
+    if info["not_modified"]:
+        count_check_path("revalidated")
+        return validators["deleted"], info
+    if deleted_flag is not None:
+        count_check_path("probe")
+        return deleted_flag, info
+    
+    # Fall back to downloading and decoding the full image
+    count_check_path("full_decode")
+    # Always from the origin, the cache may hold a copy of a deleted image
+    rate_limiter.acquire(url_str)
+    data = read_image_bytes(url_str, session)
+    # The header parser finds JPEG frame headers anywhere in the complete
+    # file, so only other formats need a full decode
+    size = read_image_size(memoryview(data))
+    if size is None:
+        size = run_cpu_task("size", data)
+    if size is None:
+        raise NotAnImageError(f"Could not decode image: {url_str}")
+    [h, w] = size
+
+    info["size"] = (h, w)
+    deleted_flag = (h, w) == REMOVED_IMG_SHAPE
+    
+    cache = get_image_cache()
+    if cache is not None and not deleted_flag:
+        cache.put(url_str, data)
+
+    return deleted_flag, info
+
+def safe_check_deleted_img(url_str, max_retries=3, session=None):
     """Safely check if image is deleted with retry logic"""
     for attempt in range(max_retries):
         try:
-            return check_deleted_img(url_str)
+            return check_deleted_img(url_str, session)
         except requests.RequestException as e:
             if attempt == max_retries - 1:
                 print(f"Failed to check image after {max_retries} attempts: {url_str}")
@@ -332,30 +2400,202 @@ def safe_check_deleted_img(url_str, max_retries=3):
             return True
     return True
 
-def compare_img(url_str, url_list):
+def compare_img(url_str, url_list, session=None):
     ignore_flag = False
 
-    img_1 = html_to_img(url_str)
-    [h_1, w_1] = [img_1.shape[0], img_1.shape[1]]
+    img_1 = html_to_img(url_str, session)
 
-    print(f"Start comparing--{url_str}")
+    print_item(f"Start comparing--{url_str}")
 
     for url_done in url_list:
-        img_2 = html_to_img(url_done)
-        [h_2, w_2] = [img_2.shape[0], img_2.shape[1]]
-
-        if [h_1, w_1] == [h_2, w_2]:
-            print(f"--Comparing with--{url_done}")
-            difference = cv.subtract(img_1, img_2)
-            b, g, r = cv.split(difference)
-            total_difference = (
-                cv.countNonZero(b) + cv.countNonZero(g) + cv.countNonZero(r)
-            )
+        # Decoded and compared in the CPU stage
+        total_difference = run_cpu_task("difference", img_1, load_image_bytes(url_done, session),
+                                        shape=img_1.shape)
+
+        if total_difference is not None:
+            print_item(f"--Comparing with--{url_done}")
             if total_difference == 0:
                 ignore_flag = True
 
     return ignore_flag
 
+def dhash_img(img, hash_size=8):
+    """Compute the difference hash (dHash) of an image as a hash_size**2 bit int"""
+    gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv.resize(gray, (hash_size + 1, hash_size), interpolation=cv.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+def hamming_distance(hash_1, hash_2):
+    return bin(hash_1 ^ hash_2).count("1")
+
+def hash_image_url(url_str, session=None):
+    """Download an image once and return its dHash"""
+    # The hash only looks at a 9x8 thumbnail, no need for full resolution
+    img_hash = run_cpu_task("dhash", load_image_bytes(url_str, session), reduce=4)
+    if img_hash is None:
+        discard_cached_image(url_str)
+        raise ValueError(f"Could not decode image: {url_str}")
+    return img_hash
+
+class BKTree:
+    """BK-tree over image hashes for Hamming distance lookups"""
+    
+    def __init__(self):
+        self.root = None  # [hash, url, {distance: child}]
+    
+    def add(self, img_hash, url_str):
+        if self.root is None:
+            self.root = [img_hash, url_str, {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming_distance(img_hash, node[0])
+            if distance == 0 and node[1] == url_str:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [img_hash, url_str, {}]
+                return
+            node = child
+    
+    def search(self, img_hash, max_distance):
+        """Return (distance, url) of all hashes within max_distance, closest first"""
+        matches = []
+        nodes = [self.root] if self.root is not None else []
+        while nodes:
+            node = nodes.pop()
+            distance = hamming_distance(img_hash, node[0])
+            if distance <= max_distance:
+                matches.append((distance, node[1]))
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    nodes.append(child)
+        return sorted(matches)
+
+class DuplicateIndex:
+    """Persistent perceptual hash index for duplicate detection
+    
+    Hashes are stored in SQLite and loaded into one BK-tree per subreddit,
+    so a new image is compared against the subreddit's history without
+    downloading anything again. URLs found to be duplicates are kept in a
+    second table, so later runs skip them without hashing them again.
+    
+    Hashes of new images are written once their posts are stored (commit).
+    Matches are confirmed with is_stored, so rows removed from the store by
+    a cleanup no longer count, and their hashes are dropped when found.
+    """
+    
+    def __init__(self, db_path, max_distance=4):
+        self.db_path = db_path
+        self.max_distance = max_distance
+        self._trees = {}
+        self._pending = {}  # (subreddit, URL): hash of images whose posts are not stored yet
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                subreddit_name TEXT NOT NULL,
+                reddit_link TEXT NOT NULL,
+                dhash INTEGER NOT NULL,
+                PRIMARY KEY (subreddit_name, reddit_link)
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS duplicate_urls (
+                subreddit_name TEXT NOT NULL,
+                reddit_link TEXT NOT NULL,
+                dhash INTEGER NOT NULL,
+                duplicate_of TEXT NOT NULL,
+                PRIMARY KEY (subreddit_name, reddit_link)
+            )""")
+        self._conn.commit()
+        
+        for subreddit_name, url_str, img_hash in self._conn.execute("SELECT * FROM image_hashes"):
+            self._tree(subreddit_name).add(img_hash & 0xFFFFFFFFFFFFFFFF, url_str)
+    
+    def _tree(self, subreddit_name):
+        if subreddit_name not in self._trees:
+            self._trees[subreddit_name] = BKTree()
+        return self._trees[subreddit_name]
+    
+    def find_duplicate(self, subreddit_name, url_str, img_hash, is_stored):
+        """Return the URL of the closest other image that is still stored, or None"""
+        with self._lock:
+            matches = self._tree(subreddit_name).search(img_hash, self.max_distance)
+        for _, match_url in matches:
+            if match_url == url_str:
+                continue
+            if is_stored(match_url):
+                return match_url
+            if (subreddit_name, match_url) not in self._pending:
+                self.forget(subreddit_name, match_url)
+        return None
+    
+    def is_duplicate(self, subreddit_name, url_str, is_stored):
+        """True if an earlier check found the URL to duplicate an image that is still stored"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT duplicate_of FROM duplicate_urls WHERE subreddit_name = ? AND reddit_link = ?",
+                (subreddit_name, url_str)).fetchone()
+        return row is not None and is_stored(row[0])
+    
+    def add_duplicate(self, subreddit_name, url_str, img_hash, duplicate_of):
+        """Remember a URL skipped as a duplicate of duplicate_of"""
+        signed_hash = img_hash - (1 << 64) if img_hash >= (1 << 63) else img_hash
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO duplicate_urls VALUES (?, ?, ?, ?)",
+                               (subreddit_name, url_str, signed_hash, duplicate_of))
+            self._conn.commit()
+    
+    def add(self, subreddit_name, url_str, img_hash):
+        """Index a new image, its hash is written by commit once its post is stored"""
+        with self._lock:
+            self._tree(subreddit_name).add(img_hash, url_str)
+            self._pending[(subreddit_name, url_str)] = img_hash
+    
+    def commit(self, subreddit_name, url_strs):
+        """Write the hashes of the given URLs, call after their posts were stored"""
+        rows = []
+        with self._lock:
+            for url_str in url_strs:
+                img_hash = self._pending.pop((subreddit_name, url_str), None)
+                if img_hash is not None:
+                    # SQLite integers are signed 64-bit
+                    signed_hash = img_hash - (1 << 64) if img_hash >= (1 << 63) else img_hash
+                    rows.append((subreddit_name, url_str, signed_hash))
+            if rows:
+                self._conn.executemany("INSERT OR REPLACE INTO image_hashes VALUES (?, ?, ?)", rows)
+                self._conn.commit()
+    
+    def forget(self, subreddit_name, url_str):
+        """Drop the stored hash of a URL that is no longer in the store"""
+        with self._lock:
+            self._conn.execute("DELETE FROM image_hashes WHERE subreddit_name = ? AND reddit_link = ?",
+                               (subreddit_name, url_str))
+            self._conn.commit()
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_duplicate_index(config, dir_path):
+    """Open the duplicate hash index if duplicate detection is enabled"""
+    scraping_settings = config.get("scraping_settings", {})
+    if not scraping_settings.get("enable_duplicate_detection", False):
+        return None
+    
+    storage_settings = config.get("storage_settings", {})
+    db_path = os.path.join(dir_path, storage_settings.get("hash_index_filename", "image_hashes.sqlite"))
+    max_distance = scraping_settings.get("duplicate_hash_distance", 4)
+    try:
+        dedup_index = DuplicateIndex(db_path, max_distance)
+        print(f"✓ Using duplicate hash index: {os.path.basename(db_path)}")
+        return dedup_index
+    except sqlite3.Error as e:
+        print(f"Could not open duplicate hash index {db_path}: {e}")
+        return None
+
 def save_urls_to_csv(data, file_path, description="URLs", append=False):
     """Save URLs to CSV file with multiple columns
     
@@ -371,12 +2611,13 @@ def save_urls_to_csv(data, file_path, description="URLs", append=False):
     
     try:
         import csv
-        headers = ['id', 'subreddit_name', 'post_title', 'reddit_link']
+        headers = CSV_HEADERS
         
         mode = "a" if append and os.path.exists(file_path) else "w"
         write_header = mode == "w" or not os.path.exists(file_path)
         
-        with open(file_path, mode=mode, encoding="utf-8-sig", newline='') as f:
+        with run_metrics.timer("csv_write"), \
+                open(file_path, mode=mode, encoding="utf-8-sig", newline='') as f:
             writer = csv.DictWriter(f, fieldnames=headers)
             if write_header:
                 writer.writeheader()
@@ -417,41 +2658,630 @@ def past_list(lst_img_dir):
     
     return past_urls  # Return just the set of URLs for checking duplicates
 
-def Reddit_API():
-    """Main scraping function"""
+def iter_batches(iterable, batch_size):
+    """Yield lists of up to batch_size items from any iterable"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class CsvCleanup:
+    """Rewrite a CSV file row by row into a temp file, then swap it in atomically
+    
+    Rows passed to keep() are written with all their columns; the original
+    file is only replaced by commit() once every row has been handled.
+    """
+    
+    def __init__(self, file_path):
+        self.file_path = file_path
+        fieldnames = None
+        if os.path.exists(file_path):
+            with open(file_path, mode="r", encoding="utf-8-sig", newline='') as f:
+                fieldnames = next(csv.reader(f), None)
+        
+        fd, self.tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".csv",
+                                             dir=os.path.dirname(file_path) or ".")
+        self._file = os.fdopen(fd, mode="w", encoding="utf-8-sig", newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=fieldnames or CSV_HEADERS,
+                                      extrasaction="ignore")
+        self._writer.writeheader()
+    
+    def keep(self, row):
+        self._writer.writerow(row)
+    
+    def remove(self, row):
+        pass
+    
+    def commit(self):
+        self._file.close()
+        os.replace(self.tmp_path, self.file_path)
+    
+    def abort(self):
+        self._file.close()
+        os.remove(self.tmp_path)
+
+class SqliteCleanup:
+    """Delete removed rows from the SQLite store in batches"""
+    
+    def __init__(self, store, subreddit_name, batch_size=500):
+        self.store = store
+        self.subreddit_name = subreddit_name
+        self.batch_size = batch_size
+        self._removed = []
+    
+    def keep(self, row):
+        pass
+    
+    def remove(self, row):
+        self._removed.append(row['reddit_link'])
+        if len(self._removed) >= self.batch_size:
+            self.store.remove_urls(self.subreddit_name, self._removed)
+            self._removed = []
+    
+    def commit(self):
+        if self._removed:
+            self.store.remove_urls(self.subreddit_name, self._removed)
+            self._removed = []
+    
+    def abort(self):
+        # Flush what is known to be removed, kept rows need no work
+        self.commit()
+
+def url_key(subreddit_name, url_str):
+    """64-bit key of a subreddit's (normalized) URL in the seen-URL index"""
+    data = f"{subreddit_name}\n{url_str.strip().lower()}".encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+class SeenUrlIndex:
+    """Compact "already seen?" index of the URLs of all subreddits of a CsvImageStore
+    
+    Each (subreddit, URL) pair is kept as a 64-bit hash (8 bytes instead of a
+    str object). All subreddits share one .npy file, memory-mapped on first
+    lookup, that holds a sorted segment of hashes per subreddit. A JSON file
+    next to it records each segment and the size and mtime of the CSV file
+    it was built from. A subreddit whose file was changed by something else
+    (or that has no segment yet) is re-indexed from its CSV file on its first
+    lookup; the other segments are used as they are.
+    
+    URLs removed by cleanup stay in the index: their image is gone, so a
+    later scrape may skip them without a check. A false "already seen"
+    needs a hash collision: about one in 10^12 per lookup with 10 million
+    stored URLs.
+    """
+    
+    def __init__(self, file_path, store):
+        self.file_path = file_path
+        self.meta_path = os.path.splitext(file_path)[0] + ".json"
+        self.store = store
+        self._lock = threading.RLock()
+        self._subreddits = None  # subreddit -> {"signature", "offset", "count"}, loaded on first use
+        self._checked = set()  # Subreddits whose signature was compared this run
+        self._hashes = None  # Memory-mapped segments, loaded on first lookup
+        self._indexed = {}  # subreddit -> sorted hashes read from its CSV file this run
+        self._added = {}  # subreddit -> hashes of URLs added this run
+        self._dirty = False
+    
+    def _signature(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+    
+    def _load_meta(self):
+        self._subreddits = {}
+        try:
+            with open(self.meta_path, 'r') as f:
+                meta = json.load(f)
+            subreddits = meta["subreddits"]
+            stale = meta["array"] != self._signature(self.file_path)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading {self.meta_path}, rebuilding the seen-URL index: {e}")
+            self._dirty = True
+            return
+        if stale:
+            # The array was written without its JSON file (interrupted save)
+            print(f"✓ {os.path.basename(self.file_path)} changed, rebuilding the seen-URL index")
+            self._dirty = True
+            return
+        self._subreddits = subreddits
+    
+    def _load_hashes(self):
+        start = time.perf_counter()
+        try:
+            self._hashes = np.load(self.file_path, mmap_mode="r")
+            if self._hashes.dtype != np.uint64 or self._hashes.ndim != 1:
+                raise ValueError("not a uint64 array")
+        except (OSError, ValueError) as e:
+            print(f"Error reading {self.file_path}, rebuilding the seen-URL index: {e}")
+            self._hashes = np.empty(0, dtype=np.uint64)
+            self._subreddits.clear()
+            self._dirty = True
+            return
+        print(f"✓ Loaded seen-URL index: {len(self._hashes)} URLs in {(time.perf_counter() - start) * 1000:.0f} ms")
+    
+    def _check(self, subreddit_name):
+        """Forget the subreddit's segment if its CSV file changed since it was built"""
+        if self._subreddits is None:
+            self._load_meta()
+        if subreddit_name in self._checked:
+            return
+        self._checked.add(subreddit_name)
+        entry = self._subreddits.get(subreddit_name)
+        if entry is not None and entry["signature"] != self._signature(self.store.path_for(subreddit_name)):
+            del self._subreddits[subreddit_name]
+            self._dirty = True
+    
+    def _segment(self, subreddit_name):
+        """Sorted hashes of the subreddit's stored URLs, indexing its CSV file if needed"""
+        self._check(subreddit_name)
+        if subreddit_name in self._indexed:
+            return self._indexed[subreddit_name]
+        
+        entry = self._subreddits.get(subreddit_name)
+        if entry is not None:
+            if self._hashes is None:
+                self._load_hashes()
+                entry = self._subreddits.get(subreddit_name)
+        if entry is not None:
+            return self._hashes[entry["offset"]:entry["offset"] + entry["count"]]
+        
+        file_path = self.store.path_for(subreddit_name)
+        signature = self._signature(file_path)
+        keys = np.fromiter((url_key(subreddit_name, row['reddit_link'])
+                            for row in self.store.iter_rows(subreddit_name) if row.get('reddit_link')),
+                           dtype=np.uint64)
+        self._indexed[subreddit_name] = np.unique(keys)
+        self._subreddits[subreddit_name] = {"signature": signature}
+        self._dirty = True
+        if signature is not None:
+            print(f"✓ Indexed {len(keys)} existing URLs from {os.path.basename(file_path)}")
+        return self._indexed[subreddit_name]
+    
+    def is_seen(self, subreddit_name, url_str):
+        key = url_key(subreddit_name, url_str)
+        with self._lock:
+            segment = self._segment(subreddit_name)
+            if key in self._added.get(subreddit_name, ()):
+                return True
+            needle = np.uint64(key)
+            i = np.searchsorted(segment, needle)
+            return bool(i < len(segment) and segment[i] == needle)
+    
+    def before_write(self, subreddit_name):
+        """Call before the store changes the subreddit's file"""
+        with self._lock:
+            self._check(subreddit_name)
+    
+    def after_write(self, subreddit_name, added_urls=()):
+        """Call after the store changed the subreddit's file, with the URLs it added"""
+        with self._lock:
+            entry = self._subreddits.get(subreddit_name)
+            if entry is None:
+                # Not indexed yet, the first lookup reads the whole file
+                return
+            if added_urls:
+                self._added.setdefault(subreddit_name, set()).update(
+                    url_key(subreddit_name, url_str) for url_str in added_urls)
+            entry["signature"] = self._signature(self.store.path_for(subreddit_name))
+            self._dirty = True
+    
+    def save(self):
+        """Write the index atomically; only the JSON file if no hashes changed"""
+        with self._lock:
+            if not self._dirty:
+                return
+            if self._indexed or self._added:
+                self._save_hashes()
+            meta = {"array": self._signature(self.file_path), "subreddits": self._subreddits}
+            with open(self.meta_path + ".tmp", 'w') as f:
+                json.dump(meta, f)
+            os.replace(self.meta_path + ".tmp", self.meta_path)
+            self._dirty = False
+    
+    def _save_hashes(self):
+        if self._hashes is None and any("offset" in entry for entry in self._subreddits.values()):
+            self._load_hashes()
+        segments = []
+        offset = 0
+        for sub, entry in self._subreddits.items():
+            if sub in self._indexed:
+                segment = self._indexed[sub]
+            elif "offset" in entry:
+                segment = self._hashes[entry["offset"]:entry["offset"] + entry["count"]]
+            else:
+                continue
+            added = self._added.get(sub)
+            if added:
+                segment = np.union1d(segment, np.fromiter(added, dtype=np.uint64, count=len(added)))
+            segments.append(np.asarray(segment))
+            entry["offset"] = offset
+            entry["count"] = len(segment)
+            offset += len(segment)
+        hashes = np.concatenate(segments) if segments else np.empty(0, dtype=np.uint64)
+        
+        # Drop the memory map before replacing its file
+        self._hashes = hashes
+        self._indexed = {}
+        self._added = {}
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, hashes)
+        os.replace(tmp_path, self.file_path)
+
+class CsvImageStore:
+    """Default storage backend: one <subreddit>_img_list.csv file per subreddit
+    
+    With seen_index_path, "already seen?" lookups use a SeenUrlIndex saved
+    there, else a set of URLs per subreddit.
+    """
+    
+    def __init__(self, dir_path, seen_index_path=None):
+        self.dir_path = dir_path
+        self.seen_index = SeenUrlIndex(seen_index_path, self) if seen_index_path else None
+        self._seen = {}  # URLs per subreddit, loaded on first lookup
+        self._lock = threading.Lock()
+    
+    def path_for(self, subreddit_name):
+        return os.path.join(self.dir_path, f"{subreddit_name}_img_list.csv")
+    
+    def exists(self, subreddit_name):
+        return os.path.exists(self.path_for(subreddit_name))
+    
+    def create(self, subreddit_name):
+        """Create an empty CSV file with only the header row"""
+        with open(self.path_for(subreddit_name), mode="w", encoding="utf-8-sig", newline='') as f:
+            csv.DictWriter(f, fieldnames=CSV_HEADERS).writeheader()
+    
+    def load_urls(self, subreddit_name):
+        return past_list(self.path_for(subreddit_name))
+    
+    def is_seen(self, subreddit_name, url_str):
+        if self.seen_index is not None:
+            return self.seen_index.is_seen(subreddit_name, url_str)
+        with self._lock:
+            if subreddit_name not in self._seen:
+                self._seen[subreddit_name] = self.load_urls(subreddit_name)
+            return url_str in self._seen[subreddit_name]
+    
+    def add_posts(self, subreddit_name, posts):
+        if self.seen_index is not None:
+            self.seen_index.before_write(subreddit_name)
+        saved = save_urls_to_csv(posts, self.path_for(subreddit_name),
+                                 f"new {subreddit_name} images", append=True)
+        if saved and self.seen_index is not None:
+            # A failed append leaves the file's signature stale, so it is re-indexed
+            self.seen_index.after_write(subreddit_name, [post['reddit_link'] for post in posts])
+        with self._lock:
+            if saved and subreddit_name in self._seen:
+                self._seen[subreddit_name].update(post['reddit_link'] for post in posts)
+        return saved
+    
+    def iter_rows(self, subreddit_name):
+        """Stream the rows of the subreddit's CSV file as dicts"""
+        file_path = self.path_for(subreddit_name)
+        if not os.path.exists(file_path):
+            return
+        with open(file_path, mode="r", encoding="utf-8-sig", newline='') as f:
+            yield from csv.DictReader(f)
+    
+    @contextmanager
+    def cleanup(self, subreddit_name):
+        """Context for rewriting the subreddit's rows, see CsvCleanup"""
+        if self.seen_index is not None:
+            self.seen_index.before_write(subreddit_name)
+        cleaner = CsvCleanup(self.path_for(subreddit_name))
+        try:
+            yield cleaner
+        except BaseException:
+            cleaner.abort()
+            raise
+        with run_metrics.timer("csv_write"):
+            cleaner.commit()
+        if self.seen_index is not None:
+            self.seen_index.after_write(subreddit_name)
+        with self._lock:
+            self._seen.pop(subreddit_name, None)
+    
+    def remove_urls(self, subreddit_name, urls):
+        """Rewrite the CSV file without the given URLs, keeping all columns"""
+        urls = set(urls)
+        try:
+            with self.cleanup(subreddit_name) as cleaner:
+                for row in self.iter_rows(subreddit_name):
+                    if row.get('reddit_link') in urls:
+                        cleaner.remove(row)
+                    else:
+                        cleaner.keep(row)
+            return True
+        except (OSError, csv.Error) as e:
+            print(f"Error cleaning {self.path_for(subreddit_name)}: {e}")
+            return False
+    
+    def close(self):
+        if self.seen_index is not None:
+            try:
+                self.seen_index.save()
+            except OSError as e:
+                print(f"Error saving seen-URL index {self.seen_index.file_path}: {e}")
+
+class SqliteImageStore:
+    """Indexed SQLite storage backend (WAL mode) shared by all subreddits
+    
+    URLs are unique per subreddit through an index on (subreddit_name,
+    reddit_link), so "already seen?" is an index lookup instead of a scan.
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                row_id INTEGER PRIMARY KEY,
+                id INTEGER,
+                subreddit_name TEXT NOT NULL,
+                post_title TEXT,
+                reddit_link TEXT NOT NULL,
+                added_at REAL NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_images_link
+                ON images (subreddit_name, reddit_link);
+            CREATE TABLE IF NOT EXISTS subreddits (
+                subreddit_name TEXT PRIMARY KEY,
+                created_at REAL NOT NULL
+            );""")
+        self._conn.commit()
+    
+    def exists(self, subreddit_name):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM subreddits WHERE subreddit_name = ?",
+                                     (subreddit_name,)).fetchone()
+        return row is not None
+    
+    def create(self, subreddit_name):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO subreddits VALUES (?, ?)",
+                               (subreddit_name, time.time()))
+    
+    def load_urls(self, subreddit_name):
+        with self._lock:
+            rows = self._conn.execute("SELECT reddit_link FROM images WHERE subreddit_name = ?",
+                                      (subreddit_name,)).fetchall()
+        return {row[0] for row in rows}
+    
+    def is_seen(self, subreddit_name, url_str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM images WHERE subreddit_name = ? AND reddit_link = ?",
+                (subreddit_name, url_str)).fetchone()
+        return row is not None
+    
+    def upsert_posts(self, subreddit_name, posts):
+        """Insert or update a batch of posts in a single transaction"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO subreddits VALUES (?, ?)",
+                               (subreddit_name, now))
+            self._conn.executemany("""
+                INSERT INTO images (id, subreddit_name, post_title, reddit_link, added_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (subreddit_name, reddit_link)
+                DO UPDATE SET post_title = excluded.post_title""",
+                [(post.get('id'), subreddit_name, post.get('post_title'), post['reddit_link'], now)
+                 for post in posts])
+    
+    def add_posts(self, subreddit_name, posts):
+        if not posts:
+            print(f"No new {subreddit_name} images to save")
+            return True
+        try:
+            with run_metrics.timer("csv_write"):
+                self.upsert_posts(subreddit_name, posts)
+            print(f"✓ Saved {len(posts)} new {subreddit_name} images to {os.path.basename(self.db_path)}")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving new {subreddit_name} images to {self.db_path}: {e}")
+            return False
+    
+    def remove_urls(self, subreddit_name, urls):
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "DELETE FROM images WHERE subreddit_name = ? AND reddit_link = ?",
+                    [(subreddit_name, url_str) for url_str in urls])
+            return True
+        except sqlite3.Error as e:
+            print(f"Error removing {subreddit_name} images from {self.db_path}: {e}")
+            return False
+    
+    def iter_rows(self, subreddit_name, page_size=1000):
+        """Stream the subreddit's rows as dicts, one page of rows at a time"""
+        last_row_id = 0
+        while True:
+            with self._lock:
+                page = self._conn.execute(
+                    "SELECT row_id, id, subreddit_name, post_title, reddit_link FROM images "
+                    "WHERE subreddit_name = ? AND row_id > ? ORDER BY row_id LIMIT ?",
+                    (subreddit_name, last_row_id, page_size)).fetchall()
+            for row in page:
+                yield dict(zip(CSV_HEADERS, row[1:]))
+            if len(page) < page_size:
+                return
+            last_row_id = page[-1][0]
+    
+    @contextmanager
+    def cleanup(self, subreddit_name):
+        """Context for removing rows while streaming, see SqliteCleanup"""
+        cleaner = SqliteCleanup(self, subreddit_name)
+        try:
+            yield cleaner
+        except BaseException:
+            cleaner.abort()
+            raise
+        with run_metrics.timer("csv_write"):
+            cleaner.commit()
+    
+    def import_csv(self, subreddit_name, csv_path, batch_size=1000):
+        """Import an existing <subreddit>_img_list.csv file, returns rows imported"""
+        imported = 0
+        batch = []
+        with open(csv_path, mode="r", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                if not row.get('reddit_link'):
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.upsert_posts(subreddit_name, batch)
+                    imported += len(batch)
+                    batch = []
+        
+        self.upsert_posts(subreddit_name, batch)
+        imported += len(batch)
+        print(f"✓ Imported {imported} URLs from {os.path.basename(csv_path)}")
+        return imported
+    
+    def export_csv(self, file_path, subreddit_names=None, since=None):
+        """Export stored posts to a CSV file in the new_img.csv summary format
+        
+        Args:
+            file_path: Path of the CSV file to write
+            subreddit_names: Only export these subreddits (default: all)
+            since: Only export posts added after this Unix timestamp
+        
+        Ids are renumbered from 1 in the order the posts were added.
+        """
+        query = "SELECT subreddit_name, post_title, reddit_link FROM images WHERE added_at >= ?"
+        params = [since or 0]
+        if subreddit_names is not None:
+            subreddit_names = list(subreddit_names)
+            query += f" AND subreddit_name IN ({', '.join('?' * len(subreddit_names))})"
+            params.extend(subreddit_names)
+        query += " ORDER BY row_id"
+        
+        count = 0
+        with self._lock, open(file_path, mode="w", encoding="utf-8-sig", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADERS)
+            for count, row in enumerate(self._conn.execute(query, params), 1):
+                writer.writerow((count, *row))
+        
+        print(f"✓ Exported {count} images to {os.path.basename(file_path)}")
+        return count
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def open_image_store(config, dir_path, subreddit_names=()):
+    """Open the storage backend selected in storage_settings
+    
+    With the SQLite backend, existing CSV files of subreddit_names that
+    were never imported are imported on the way.
+    """
+    storage_settings = config.get("storage_settings", {})
+    backend = storage_settings.get("backend", "csv")
+    
+    if backend == "sqlite":
+        db_path = os.path.join(dir_path, storage_settings.get("sqlite_filename", "reddit_images.sqlite"))
+        store = SqliteImageStore(db_path)
+        print(f"✓ Using SQLite image store: {os.path.basename(db_path)}")
+        
+        csv_store = CsvImageStore(dir_path)
+        for subreddit_name in subreddit_names:
+            if not store.exists(subreddit_name) and csv_store.exists(subreddit_name):
+                store.import_csv(subreddit_name, csv_store.path_for(subreddit_name))
+        return store
+    
+    if backend != "csv":
+        print(f"Warning: Unknown storage backend '{backend}', using csv")
+    seen_index_filename = storage_settings.get("seen_index_filename", "seen_urls.npy")
+    return CsvImageStore(dir_path, os.path.join(dir_path, seen_index_filename) if seen_index_filename else None)
+
+def Reddit_API(resume=None, shard=None, overrides=None):
+    """Main scraping function
+    
+    Args:
+        resume: Continue an interrupted run from its journal (None: ask if
+            there is one)
+        shard: (index, count) to scrape only that shard of sub_list.csv,
+            see shard_subreddits()
+        overrides: Settings replacing those of reddit_config.json, as
+            {section: {key: value}}
+    
+    Returns False if the run could not start (no configuration, Reddit
+    client or subreddits), else True.
+    """
     # Load configuration
     config = load_config(dir_path)  # Use your updated config function
     if not config:
         print("Failed to load configuration. Exiting...")
-        return
+        return False
+    apply_run_options(config, shard, overrides)
 
     # Setup logging after config is loaded
     logger = setup_logging(config)
     logger.info("Starting Reddit Image Scraper...")
+    run_metrics.reset("scrape")
 
     # Create Reddit client
-    reddit = create_reddit_client(config["reddit_credentials"])
+    reddit = create_reddit_client(config["reddit_credentials"],
+                                  config["scraping_settings"].get("verify_login", True))
     if not reddit:
-        return
+        return False
         
-    print("\nNote: For any new subreddits without existing CSV files, you will be prompted to confirm creation.")
+    if config["scraping_settings"].get("auto_create_subreddit_files") is None and interactive:
+        print("\nNote: For any new subreddits without existing CSV files, you will be prompted to confirm creation.")
     
     # Get list of subreddits to process
     subreddits_to_process = read_subreddit_list(lst_sub_dir)
+    if shard is not None:
+        subreddits_to_process = shard_subreddits(subreddits_to_process, shard)
     if not subreddits_to_process:
         print("No valid subreddits found. Exiting...")
-        return
+        return False
+    
+    # Open the caches, store and fetch engine shared by all subreddits
+    context = ScrapeContext(config, dir_path, subreddits_to_process)
+    context.journal = open_run_journal(config, dir_path, "scrape", resume)
+    max_parallel = config.get("performance_settings", {}).get("max_parallel_subreddits", 4)
     
     # Process all subreddits
     all_new_posts_data = []
     all_new_images = []
     total_processed = 0
     
-    for subreddit_name in subreddits_to_process:
-        new_posts_data, new_images, all_images = process_subreddit(reddit, subreddit_name, config, dir_path)
-        all_new_posts_data.extend(new_posts_data)
-        all_new_images.extend(new_images)
-        total_processed += len(new_images)
+    try:
+        # Settle new subreddits first, so prompts don't block the parallel run
+        subreddits_to_scrape = [sub for sub in subreddits_to_process
+                                if ensure_subreddit_created(sub, context.store, config, dir_path)]
+        
+        with stop_on_interrupt(context.stop), ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+            results = executor.map(
+                lambda sub: process_subreddit(reddit, sub, config, dir_path, context),
+                subreddits_to_scrape)
+            
+            # Results come back in sub_list.csv order, so summary ids are stable
+            for new_posts_data, new_images, all_images in results:
+                all_new_posts_data.extend(new_posts_data)
+                all_new_images.extend(new_images)
+                total_processed += len(new_images)
+    finally:
+        context.close()
+    
+    if context.stop.is_set():
+        print("✓ Progress saved, run again and resume to continue")
+        raise KeyboardInterrupt
+    if not context.journal.finish():
+        print("Some new images could not be saved, run again and resume to retry them")
     
     # Save summary file with all new images
     if all_new_posts_data:
@@ -468,66 +3298,367 @@ def Reddit_API():
     print(f"✓ Scraping Complete!")
     print(f"✓ Processed {len(subreddits_to_process)} subreddits")
     print(f"✓ Found {total_processed} new images total")
+    print_check_stats()
+    print_startup_stats()
     if all_new_images:
         print(f"✓ Summary saved to: {summary_filename}")
+    write_run_report(config, dir_path)
     print(f"{'='*50}")
+    return True
 
-def scan_csv():
-    """Scan and clean existing CSV files - restructured"""
+def scan_csv(resume=None, shard=None, overrides=None):
+    """Scan and clean existing CSV files - restructured
+    
+    Args:
+        resume: Continue an interrupted cleanup from its journal (None: ask
+            if there is one)
+        shard: (index, count) to clean only that shard of sub_list.csv
+        overrides: Settings replacing those of reddit_config.json
+    
+    Returns False if the run could not start (no configuration or
+    subreddits), else True.
+    """
     print("Starting CSV cleanup scan...")
     
     # Get list of subreddits to scan
     subreddits_to_scan = read_subreddit_list(lst_sub_dir)
+    if shard is not None:
+        subreddits_to_scan = shard_subreddits(subreddits_to_scan, shard)
     if not subreddits_to_scan:
         print("No subreddits found to scan")
-        return
+        return False
+    
+    # Recently checked URLs are answered from the cache
+    config = load_config(dir_path)
+    if not config:
+        print("Failed to load configuration. Exiting...")
+        return False
+    apply_run_options(config, shard, overrides)
+    run_metrics.reset("clean")
+    context = ScrapeContext(config, dir_path, subreddits_to_scan, mode="clean")
+    context.journal = open_run_journal(config, dir_path, "clean", resume)
     
     total_removed = 0
     
-    for sub in subreddits_to_scan:
-        removed_count = scan_subreddit_csv(sub)
-        total_removed += removed_count
+    try:
+        if context.scheduler is not None:
+            context.scheduler.plan(subreddits_to_scan, context.store, context.cache, context.journal)
+        with stop_on_interrupt(context.stop):
+            for sub in subreddits_to_scan:
+                removed_count = scan_subreddit_csv(sub, context)
+                total_removed += removed_count
+                if context.stop.is_set():
+                    break
+    finally:
+        context.close()
+    
+    if context.stop.is_set():
+        print("✓ Progress saved, run again and resume to continue")
+        raise KeyboardInterrupt
+    context.journal.finish()
     
     print(f"\n✓ CSV cleanup complete! Removed {total_removed} broken URLs total")
+    print_check_stats()
+    print_startup_stats()
+    write_run_report(config, dir_path)
+    return True
 
-def scan_subreddit_csv(subreddit_name):
-    """Scan and clean a single subreddit's CSV file"""
+def scan_subreddit_csv(subreddit_name, context=None):
+    """Scan and clean a single subreddit's stored images
+    
+    Rows are streamed from the store and checked in concurrent batches, and
+    survivors are written back with all their columns, so memory use does
+    not grow with the size of the file. The file is rewritten every
+    progress_save_seconds, with the rows not checked yet kept as they are,
+    and the run journal records how many leading rows are done. With a
+    cleanup request budget, only the rows chosen by the scheduler are checked.
+    Rows whose check failed are kept if the error was transient, until
+    cleanup_max_failures checks in a row failed.
+    """
+    if context is None:
+        context = ScrapeContext(load_config(dir_path), dir_path, [subreddit_name], mode="clean")
+        try:
+            if context.scheduler is not None:
+                context.scheduler.plan([subreddit_name], context.store, context.cache)
+            return scan_subreddit_csv(subreddit_name, context)
+        finally:
+            context.close()
+    
     lst_img_name = f"{subreddit_name}_img_list.csv"
-    lst_img_dir = os.path.join(dir_path, lst_img_name)
+    
+    journal = context.journal
+    if journal is not None and journal.is_done(subreddit_name):
+        print(f"✓ {lst_img_name} was cleaned by the interrupted run, skipped")
+        return journal.removed(subreddit_name)
     
     print(f"\n--- Scanning {lst_img_name} ---")
     
-    # Load existing URLs
-    already_done_set = past_list(lst_img_dir)
-    if not already_done_set:
+    perf_settings = context.config.get("performance_settings", {})
+    batch_size = perf_settings.get("cleanup_batch_size", 200)
+    max_workers = perf_settings.get("max_workers", 8)
+    save_seconds = perf_settings.get("progress_save_seconds", 60)
+    max_failures = perf_settings.get("cleanup_max_failures", 5)
+    
+    store = context.store
+    if not store.exists(subreddit_name):
         print(f"No URLs found in {lst_img_name}")
         return 0
     
-    valid_urls = []
+    scheduler = context.scheduler
+    if scheduler is not None and not scheduler.selected_count(subreddit_name):
+        # Nothing due, don't rewrite the file
+        print(f"✓ {subreddit_name}: No URLs chosen for this pass")
+        if journal is not None:
+            journal.mark_done(subreddit_name)
+        return 0
+    
+    def is_due(row):
+        return bool(row.get('reddit_link')) and (
+            scheduler is None or scheduler.is_selected(subreddit_name, row['reddit_link']))
+    
+    # Leading rows checked by earlier passes (or the interrupted run)
+    position = journal.position(subreddit_name) if journal is not None else 0
+    removed_before = journal.removed(subreddit_name) if journal is not None else 0
+    if position:
+        print(f"✓ Resuming after {position} checked rows")
+    
+    kept_count = 0
     removed_count = 0
+    error_count = 0
+    removed_after_error = 0
+    i = 0
+    finished = False
     
-    for i, url_str in enumerate(already_done_set, 1):
-        try:
-            deleted_flag = check_deleted_img(url_str)
+    while not finished and not context.stop.is_set():
+        with store.cleanup(subreddit_name) as cleaner:
+            rows = store.iter_rows(subreddit_name)
+            for row in itertools.islice(rows, position):
+                cleaner.keep(row)
             
-            if not deleted_flag:
-                valid_urls.append(url_str)
-                print(f"ID-{i}: ✓ Keep - {url_str}")
-            else:
-                removed_count += 1
-                print(f"ID-{i}: ✗ Remove - {url_str}")
+            finished = True
+            next_save = time.monotonic() + save_seconds
+            for batch in iter_batches(rows, batch_size):
+                # Rows without a URL (or not chosen by the scheduler) are kept as they are
+                urls = [row['reddit_link'] for row in batch if is_due(row)]
+                checked = iter_checked_images(urls, context.fetch_engine, max_workers=max_workers,
+                                              cache=context.cache, limits=context.request_limits)
                 
-        except Exception as e:
-            removed_count += 1
-            print(f"ID-{i}: ✗ Error checking - {url_str}: {e}")
+                for j, row in enumerate(batch):
+                    if context.stop.is_set():
+                        # Unchecked rows of the batch are checked next time
+                        for unchecked_row in batch[j:]:
+                            cleaner.keep(unchecked_row)
+                        break
+                    
+                    if not is_due(row):
+                        cleaner.keep(row)
+                        position += 1
+                        continue
+                    
+                    i += 1
+                    url_str, deleted_flag, error, _ = next(checked)
+                    if error is not None:
+                        # Without the URL cache failures can't be counted, transient ones are always kept
+                        failures = context.cache.record_failure(url_str) if context.cache is not None else None
+                        deleted_flag = not is_transient_error(error) or (failures is not None
+                                                                         and failures >= max_failures)
+                    if scheduler is not None and (error is None or deleted_flag):
+                        scheduler.record(subreddit_name, url_str, deleted_flag)
+                    if error is not None and not deleted_flag:
+                        # Timeouts and throttling say nothing about the image, check it next time
+                        error_count += 1
+                        cleaner.keep(row)
+                        position += 1
+                        print(f"ID-{i}: ✗ Error checking, kept"
+                              + (f" ({failures} failures in a row)" if failures else "")
+                              + f" - {url_str}: {error}")
+                    elif error is not None:
+                        removed_count += 1
+                        removed_after_error += 1
+                        cleaner.remove(row)
+                        print(f"ID-{i}: ✗ Error checking, removed - {url_str}: {error}")
+                    elif not deleted_flag:
+                        kept_count += 1
+                        cleaner.keep(row)
+                        position += 1
+                        print_item(f"ID-{i}: ✓ Keep - {url_str}")
+                    else:
+                        removed_count += 1
+                        cleaner.remove(row)
+                        print_item(f"ID-{i}: ✗ Remove - {url_str}")
+                checked.close()
+                
+                if context.stop.is_set() or time.monotonic() >= next_save:
+                    finished = False
+                    break
+            
+            # Rows not checked yet are kept until the next pass
+            for row in rows:
+                cleaner.keep(row)
+        
+        if journal is not None:
+            journal.set_position(subreddit_name, position, removed_before + removed_count)
+    
+    if context.stop.is_set():
+        print(f"✓ {subreddit_name}: Saved progress after {position} kept rows")
+        return removed_count
+    if journal is not None:
+        journal.mark_done(subreddit_name)
+    
+    if i == 0 and not position:
+        print(f"No URLs found in {lst_img_name}")
+        return 0
+    
+    run_metrics.count("csv_write", "rows_kept", kept_count)
+    run_metrics.count("csv_write", "rows_removed", removed_count)
+    run_metrics.count("csv_write", "rows_kept_after_error", error_count)
+    run_metrics.count("csv_write", "rows_removed_after_error", removed_after_error)
+    print(f"✓ {subreddit_name}: Kept {kept_count}, Removed {removed_count}"
+          + (f", Kept {error_count} that could not be checked" if error_count else ""))
+    return removed_before + removed_count
+
+def parse_shard(value):
+    """Parse "i/N" (1 <= i <= N) into (i, N)"""
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", value)
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError(f"expected i/N with 1 <= i <= N, got '{value}'")
+    return int(match.group(1)), int(match.group(2))
+
+def shard_subreddits(subreddits, shard):
+    """Return the subreddits belonging to shard (index, count), index from 1
+    
+    A subreddit's shard depends only on a hash of its lowercased name, so
+    every machine picks the same subreddits whatever the order of
+    sub_list.csv, and adding a subreddit doesn't move the others.
+    """
+    index, count = shard
+    selected = [sub for sub in subreddits if zlib.crc32(sub.lower().encode()) % count == index - 1]
+    print(f"✓ Shard {index}/{count}: {len(selected)} of {len(subreddits)} subreddits")
+    return selected
+
+def shard_file_name(file_name, shard):
+    """Add the shard to a file name: new_img.csv -> new_img.shard2of4.csv"""
+    root, ext = os.path.splitext(file_name)
+    return f"{root}.shard{shard[0]}of{shard[1]}{ext}"
+
+def apply_run_options(config, shard=None, overrides=None):
+    """Apply command line overrides and per-shard file names to a loaded config"""
+    for section, values in (overrides or {}).items():
+        config.setdefault(section, {}).update(values)
+    if shard is not None:
+        for section, key, default in SHARDED_FILES:
+            file_name = config.get(section, {}).get(key, default)
+            if file_name:
+                config.setdefault(section, {})[key] = shard_file_name(file_name, shard)
+    return config
+
+def merge_summaries(file_paths, output_path):
+    """Combine per-shard summary files into one, renumbering the ids
+    
+    Rows keep the order of file_paths; a URL found by several shards is
+    only kept once. Returns the number of rows written.
+    """
+    merged = []
+    seen = set()
+    for file_path in file_paths:
+        try:
+            with open(file_path, mode="r", encoding="utf-8-sig", newline='') as f:
+                for row in csv.DictReader(f):
+                    key = (row.get('subreddit_name'), row.get('reddit_link'))
+                    if not row.get('reddit_link') or key in seen:
+                        continue
+                    seen.add(key)
+                    merged.append(row)
+        except OSError as e:
+            print(f"Error reading {file_path}: {e}")
+            continue
+        print(f"✓ Read {os.path.basename(file_path)}")
     
-    # Save cleaned list
-    save_urls_to_csv(valid_urls, lst_img_dir, f"cleaned {subreddit_name} images")
+    for i, row in enumerate(merged, 1):
+        row['id'] = i
+    save_urls_to_csv(merged, output_path, "merged new images")
+    return len(merged)
+
+def find_shard_summaries(summary_filename):
+    """Return the shard files of a summary file name, in shard order"""
+    root, ext = os.path.splitext(summary_filename)
+    pattern = os.path.join(dir_path, f"{glob.escape(root)}.shard*of*{glob.escape(ext)}")
+    
+    def shard_index(file_path):
+        match = re.search(r"\.shard(\d+)of(\d+)", os.path.basename(file_path))
+        return (int(match.group(2)), int(match.group(1))) if match else (0, 0)
+    
+    return sorted(glob.glob(pattern), key=shard_index)
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Reddit Image Scraper. Without a command, shows the interactive menu.")
+    commands = parser.add_subparsers(dest="command")
+    
+    for name, help_text in (("scrape", "Scrape new images"),
+                            ("clean", "Clean existing CSV files"),
+                            ("both", "Scrape, then clean")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--shard", type=parse_shard, metavar="I/N",
+                             help="Process only shard I of N of sub_list.csv")
+        command.add_argument("--resume", action=argparse.BooleanOptionalAction, default=None,
+                             help="Continue an interrupted run (default: resume if one was interrupted)")
+        command.add_argument("--new-subreddits", choices=("create", "skip"),
+                             help="What to do with subreddits without a file "
+                                  "(default: auto_create_subreddit_files, skip if unset)")
+        command.add_argument("--quiet", action="store_true",
+                             help="Don't print a line per post/URL")
+    
+    merge = commands.add_parser("merge", help="Combine the per-shard summary files into one")
+    merge.add_argument("files", nargs="*",
+                       help="Shard summary files (default: all <summary_filename>.shard*of*.csv files)")
+    merge.add_argument("-o", "--output", help="Merged file (default: summary_filename)")
+    return parser
+
+def run_command(args):
+    """Run a parsed command line, returns the exit status"""
+    global interactive
+    interactive = False
+    
+    if args.command == "merge":
+        config = load_config(dir_path)
+        summary_filename = (config or {}).get("output_settings", {}).get("summary_filename", "new_img.csv")
+        files = args.files or find_shard_summaries(summary_filename)
+        if not files:
+            print(f"No shard files of {summary_filename} found")
+            return 1
+        output_path = args.output or os.path.join(dir_path, summary_filename)
+        merge_summaries(files, output_path)
+        return 0
+    
+    overrides = {}
+    if args.new_subreddits is not None:
+        overrides["scraping_settings"] = {"auto_create_subreddit_files": args.new_subreddits == "create"}
+    if args.quiet:
+        overrides["output_settings"] = {"per_item_output": False}
+    
+    ok = True
+    if args.command in ("scrape", "both"):
+        ok = Reddit_API(resume=args.resume, shard=args.shard, overrides=overrides)
+    if args.command == "both":
+        print("\nNow cleaning CSV files...")
+    if args.command in ("clean", "both"):
+        ok = scan_csv(resume=args.resume, shard=args.shard, overrides=overrides) and ok
+    return 0 if ok else 1
+
+def main(argv=None):
+    """Command line entry point, shows the interactive menu without a command"""
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        return interactive_menu()
     
-    print(f"✓ {subreddit_name}: Kept {len(valid_urls)}, Removed {removed_count}")
-    return removed_count
+    try:
+        return run_command(args)
+    except KeyboardInterrupt:
+        print("\n\nOperation cancelled by user")
+        return 130
 
-def main():
+def interactive_menu():
     """Main entry point with user options"""
     print("Reddit Image Scraper")
     print("1. Scrape new images")
@@ -554,5 +3685,7 @@ def main():
     except Exception as e:
         print(f"Unexpected error: {e}")
 
+module_import_seconds = time.perf_counter() - import_started
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,419 @@
+"""Benchmarks for the Reddit image scraper against a local mock server
+
+Runs scripted scenarios without touching Reddit or real image hosts:
+a local HTTP server serves synthetic images (including the 60x130 "removed"
+placeholder, slow answers and 429s) and a fake PRAW client serves listings.
+
+Usage:
+    python benchmark.py                       # default scenarios
+    python benchmark.py scrape-100k           # one or more named scenarios
+    python benchmark.py --list                # show all scenarios
+    python benchmark.py --json results.json   # also save the report
+"""
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import wraps
+
+import cv2 as cv
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import Reddit_API
+
+"""Start Scenarios"""
+SCENARIOS = {
+    "scrape-1k": {
+        "description": "Scrape 1k posts over 10 subreddits, 10% removed",
+        "mode": "scrape", "urls": 1000, "subreddits": 10, "removed": 0.1,
+    },
+    "scrape-100k": {
+        "description": "Scrape 100k posts over 100 subreddits, 10% removed",
+        "mode": "scrape", "urls": 100000, "subreddits": 100, "removed": 0.1,
+    },
+    "scrape-slow": {
+        "description": "Scrape 1k posts with 20% slow answers and 5% 429s, rate limit on",
+        "mode": "scrape", "urls": 1000, "subreddits": 10, "removed": 0.1,
+        "slow": 0.2, "throttled": 0.05,
+        # All mock URLs share one host, so it starts fast and may speed up further
+        "rate_limit_delay": 0.005, "rate_limit_max_per_second": 1000,
+    },
+    "dedup-heavy": {
+        "description": "Scrape 1k posts of only 20 distinct images, duplicate detection on",
+        "mode": "scrape", "urls": 1000, "subreddits": 5, "removed": 0.05,
+        "variants": 20, "dedup": True,
+    },
+    "dedup-pool": {
+        "description": "dedup-heavy with decoding and hashing in 2 worker processes",
+        "mode": "scrape", "urls": 1000, "subreddits": 5, "removed": 0.05,
+        "variants": 20, "dedup": True, "cpu_processes": 2,
+    },
+    "cleanup-1k": {
+        "description": "Clean 1k stored URLs over 10 subreddits, 30% removed",
+        "mode": "clean", "urls": 1000, "subreddits": 10, "removed": 0.3,
+    },
+    "cleanup-heavy": {
+        "description": "Clean 100k stored URLs over 20 subreddits, 50% removed",
+        "mode": "clean", "urls": 100000, "subreddits": 20, "removed": 0.5,
+    },
+    "compare": {
+        "description": "compare_img of one image against 200 stored ones",
+        "mode": "compare", "urls": 200, "subreddits": 1, "removed": 0.0,
+    },
+}
+
+DEFAULT_SCENARIOS = ["scrape-1k", "scrape-slow", "dedup-heavy", "cleanup-1k", "compare"]
+
+# Module functions timed as pipeline stages
+TIMED_STAGES = {
+    "process_subreddit": "subreddit",
+    "check_deleted_img": "deletion_check",
+    "html_to_img": "decode",
+    "run_cpu_task": "cpu_task",
+    "hash_image_url": "dedup_hash",
+    "compare_img": "compare",
+    "scan_subreddit_csv": "cleanup_subreddit",
+}
+
+SLOW_DELAY = 0.2  # Seconds added to "slow" answers
+"""End Scenarios"""
+
+def make_images(variants):
+    """Encode the synthetic images served by the mock server"""
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(variants):
+        img = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+        images.append(cv.imencode(".jpg", img)[1].tobytes())
+    removed = cv.imencode(".png", np.full((60, 130, 3), 200, dtype=np.uint8))[1].tobytes()
+    return images, removed
+
+class MockImageServer:
+    """Local stand-in for image hosts
+
+    URLs look like /<kind>/<n>.jpg where kind is ok, removed, slow or
+    throttled; throttled URLs answer 429 on their first request.
+    """
+
+    def __init__(self, variants=50):
+        self.images, self.removed = make_images(variants)
+        self.bytes_sent = 0
+        self.requests = 0
+        self._throttled_once = set()
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, kind, n):
+        return f"{self.base_url}/{kind}/{n}.jpg"
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+
+        parts = request.path.split("?")[0].strip("/").split("/")
+        kind, n = parts[0], int(parts[-1].split(".")[0])
+
+        if kind == "throttled":
+            with self._lock:
+                first = n not in self._throttled_once
+                self._throttled_once.add(n)
+            if first:
+                self.send(request, 429, b"", {"Retry-After": "0"})
+                return
+        if kind == "slow":
+            time.sleep(SLOW_DELAY)
+
+        data = self.removed if kind == "removed" else self.images[n % len(self.images)]
+        etag = f'"{kind}-{n % len(self.images)}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.send(request, 304, b"", {"ETag": etag})
+            return
+
+        status, headers = 200, {"ETag": etag, "Content-Type": "image/jpeg"}
+        byte_range = request.headers.get("Range")
+        if byte_range and byte_range.startswith("bytes="):
+            start, end = byte_range[6:].split("-")
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+            status, data = 206, data[start:end + 1]
+        self.send(request, status, data, headers)
+
+    def send(self, request, status, body, headers):
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        try:
+            request.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            return  # Client aborted the download on purpose
+        with self._lock:
+            self.bytes_sent += len(body)
+
+class FakeSubmission:
+    """The submission attributes the scraper reads"""
+
+    def __init__(self, n, url, created_utc):
+        self.url = url
+        self.title = f"Post {n}"
+        self.domain = "127.0.0.1"
+        self.created_utc = created_utc
+        self.fullname = f"t3_{n:x}"
+        self.id = f"{n:x}"
+
+class FakeSubreddit:
+    def __init__(self, submissions):
+        self.submissions = submissions
+
+    def listing(self, limit=None):
+        yield from self.submissions[:limit]
+
+    top = new = hot = listing
+
+class FakeReddit:
+    """Stand-in for praw.Reddit serving pre-built listings"""
+
+    def __init__(self, listings):
+        self.listings = listings
+
+    def subreddit(self, subreddit_name):
+        return FakeSubreddit(self.listings.get(subreddit_name, []))
+
+def pick_kind(rng, scenario):
+    roll = rng.random()
+    for kind in ("removed", "slow", "throttled"):
+        share = scenario.get(kind, 0.0)
+        if roll < share:
+            return kind
+        roll -= share
+    return "ok"
+
+def build_urls(server, scenario, rng):
+    """Return {subreddit_name: [url, ...]} for the scenario"""
+    subreddits = [f"bench{i}" for i in range(scenario["subreddits"])]
+    urls = {sub: [] for sub in subreddits}
+    for n in range(scenario["urls"]):
+        urls[subreddits[n % len(subreddits)]].append(server.url(pick_kind(rng, scenario), n))
+    return urls
+
+def write_config(work_dir, scenario, post_limit):
+    config = {
+        "reddit_credentials": {},
+        "scraping_settings": {
+            "post_limit": post_limit,
+            "search_type": "top",
+            "supported_formats": ["jpg", "png", "jpeg"],
+            "excluded_domains": [],
+            "enable_duplicate_detection": scenario.get("dedup", False),
+            "enable_deleted_image_check": True,
+            "auto_create_subreddit_files": True,
+        },
+        "performance_settings": {
+            "request_timeout_seconds": 30,
+            "retry_attempts": 3,
+            "rate_limit_delay": scenario.get("rate_limit_delay", 0),
+            "rate_limit_max_per_second": scenario.get("rate_limit_max_per_second", 20),
+            "max_workers": 16,
+            "max_requests_per_host": 16,
+            "max_parallel_subreddits": 4,
+            "reddit_requests_per_minute": 60000,  # The fake client has no API limit
+            "cpu_processes": scenario.get("cpu_processes", 0),
+        },
+        "output_settings": {
+            "csv_encoding": "utf-8-sig",
+            "summary_filename": "new_img.csv",
+        },
+    }
+    with open(os.path.join(work_dir, "reddit_config.json"), "w") as f:
+        json.dump(config, f, indent=4)
+
+def time_stages(latencies):
+    """Wrap the stage functions of Reddit_API to record their latencies"""
+    def timed(func, stage):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                latencies.setdefault(stage, []).append(time.perf_counter() - start)
+        return wrapper
+
+    for func_name, stage in TIMED_STAGES.items():
+        setattr(Reddit_API, func_name, timed(getattr(Reddit_API, func_name), stage))
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def run_scenario(name, scenario, quiet=True):
+    """Run one scenario in the current process and return its report"""
+    rng = random.Random(0)
+    latencies = {}
+    time_stages(latencies)
+
+    with MockImageServer(variants=scenario.get("variants", 50)) as server, \
+            tempfile.TemporaryDirectory() as work_dir:
+        urls = build_urls(server, scenario, rng)
+        post_limit = max(len(sub_urls) for sub_urls in urls.values())
+        write_config(work_dir, scenario, post_limit)
+        with open(os.path.join(work_dir, "sub_list.csv"), "w", encoding="utf-8-sig") as f:
+            f.write("\n".join(urls) + "\n")
+
+        Reddit_API.dir_path = work_dir
+        Reddit_API.lst_sub_dir = os.path.join(work_dir, "sub_list.csv")
+        Reddit_API.setup_logging = lambda config: Reddit_API.logging.getLogger("benchmark")
+
+        output = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(output):
+            if scenario["mode"] == "clean":
+                for sub, sub_urls in urls.items():
+                    rows = [{"id": i, "subreddit_name": sub, "post_title": f"Post {i}", "reddit_link": url}
+                            for i, url in enumerate(sub_urls, 1)]
+                    Reddit_API.save_urls_to_csv(rows, os.path.join(work_dir, f"{sub}_img_list.csv"))
+            else:
+                listings = {sub: [FakeSubmission(n, url, 1.6e9 - n) for n, url in enumerate(sub_urls)]
+                            for sub, sub_urls in urls.items()}
+                Reddit_API.create_reddit_client = lambda credentials, verify_login=True: FakeReddit(listings)
+
+        cwd = os.getcwd()
+        os.chdir(work_dir)
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                if scenario["mode"] == "scrape":
+                    Reddit_API.Reddit_API()
+                elif scenario["mode"] == "clean":
+                    Reddit_API.scan_csv()
+                else:
+                    # No ScrapeContext here: apply the scenario's rate limit and pools by hand
+                    config = Reddit_API.load_config(work_dir)
+                    Reddit_API.rate_limiter.configure(config)
+                    engine = Reddit_API.FetchEngine.from_config(config)
+                    Reddit_API.set_fetch_engine(engine)
+                    try:
+                        all_urls = [url for sub_urls in urls.values() for url in sub_urls]
+                        Reddit_API.compare_img(all_urls[0], all_urls[1:])
+                    finally:
+                        Reddit_API.set_fetch_engine(None)
+                        engine.close()
+        finally:
+            elapsed = time.perf_counter() - start
+            os.chdir(cwd)
+
+        return {
+            "scenario": name,
+            "description": scenario["description"],
+            "urls": scenario["urls"],
+            "seconds": round(elapsed, 3),
+            "urls_per_second": round(scenario["urls"] / elapsed, 1) if elapsed else None,
+            "requests": server.requests,
+            "bytes_transferred": server.bytes_sent,
+            "peak_rss_mb": round(peak_rss_mb(), 1) if resource is not None else None,
+            "stages": {
+                stage: {
+                    "calls": len(values),
+                    "p50_ms": round(percentile(values, 50) * 1000, 2),
+                    "p99_ms": round(percentile(values, 99) * 1000, 2),
+                }
+                for stage, values in latencies.items()
+            },
+            "startup": Reddit_API.run_metrics.startup_report(),
+            "pipeline": Reddit_API.run_metrics.report()["stages"],
+        }
+
+def run_isolated(name, scenario, quiet=True):
+    """Run a scenario in a child process, so peak RSS is per scenario"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_scenario, name, scenario, quiet).result()
+
+def print_report(report):
+    print(f"\n--- {report['scenario']}: {report['description']} ---")
+    print(f"✓ {report['urls']} URLs in {report['seconds']}s ({report['urls_per_second']} URLs/s)")
+    print(f"✓ {report['requests']} requests, {report['bytes_transferred'] / 1e6:.1f} MB transferred")
+    if report["peak_rss_mb"] is not None:
+        print(f"✓ Peak RSS: {report['peak_rss_mb']} MB")
+    for stage, stats in report["stages"].items():
+        print(f"  {stage:<20} {stats['calls']:>8} calls  p50 {stats['p50_ms']:>9.2f} ms  "
+              f"p99 {stats['p99_ms']:>9.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper against a local mock server")
+    parser.add_argument("scenarios", nargs="*", help="Scenarios to run (default: the quick ones)")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    parser.add_argument("--urls", type=int, help="Override the number of URLs of every scenario")
+    parser.add_argument("--json", help="Save the reports to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's own output")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(f"{name:<15} {scenario['description']}")
+        return
+
+    names = args.scenarios or DEFAULT_SCENARIOS
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario(s): {', '.join(unknown)}")
+
+    reports = []
+    for name in names:
+        scenario = dict(SCENARIOS[name])
+        if args.urls:
+            scenario["urls"] = args.urls
+        report = run_isolated(name, scenario, quiet=not args.verbose)
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=4)
+        print(f"\n✓ Reports saved to {args.json}")
+
+if __name__ == "__main__":
+    main()